@@ -0,0 +1,108 @@
+import asyncio
+from time import perf_counter
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+from metrics import ADMISSION_IN_FLIGHT
+from metrics import ADMISSION_QUEUE_DEPTH
+from metrics import ADMISSION_QUEUE_WAIT
+from metrics import ADMISSION_REJECTED
+
+
+def busy_response(retry_after: int) -> JSONResponse:
+    """503 response which asks the client to retry after retry_after seconds"""
+    return JSONResponse(
+        {"detail": "Server is busy, try again later."},
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+class AdmissionLimit:
+    """Concurrency limit of a route with a bounded queue of waiting requests"""
+
+    def __init__(
+        self, name: str, concurrency: int, queue_size: int, queue_timeout: float
+    ):
+        self.name = name
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._waiting = 0
+
+    async def acquire(self) -> bool:
+        """Take a slot, False if the request should be rejected"""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            ADMISSION_IN_FLIGHT.labels(self.name).inc()
+            return True
+
+        if self._waiting >= self.queue_size:
+            ADMISSION_REJECTED.labels(self.name, "queue_full").inc()
+            return False
+
+        self._waiting += 1
+        ADMISSION_QUEUE_DEPTH.labels(self.name).inc()
+        start = perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTED.labels(self.name, "timeout").inc()
+            return False
+        finally:
+            self._waiting -= 1
+            ADMISSION_QUEUE_DEPTH.labels(self.name).dec()
+            ADMISSION_QUEUE_WAIT.labels(self.name).observe(perf_counter() - start)
+
+        ADMISSION_IN_FLIGHT.labels(self.name).inc()
+        return True
+
+    def release(self) -> None:
+        ADMISSION_IN_FLIGHT.labels(self.name).dec()
+        self._semaphore.release()
+
+
+class AdmissionControlMiddleware:
+    """Limits concurrent requests to expensive routes.
+
+    limits maps (method, path) to AdmissionLimit. Requests above the limit
+    wait in the queue of the route; when the queue is full or the wait
+    takes longer than queue_timeout they are rejected with 503 and
+    Retry-After, so expensive routes can not occupy the whole worker.
+    Other routes are not limited.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limits: dict[tuple[str, str], AdmissionLimit],
+        retry_after: int = 1,
+    ):
+        self.app = app
+        self.limits = limits
+        self.retry_after = retry_after
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limits.get((scope["method"], scope["path"]))
+
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await limit.acquire():
+            response = busy_response(self.retry_after)
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.release()
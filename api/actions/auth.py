@@ -1,4 +1,13 @@
+import asyncio
+import hashlib
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from logging import getLogger
+from time import time
+from typing import Optional
 from typing import Union
+from uuid import UUID
 
 from fastapi import Depends
 from fastapi import HTTPException
@@ -9,47 +18,208 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 import settings
-from db.dals import UserDAL
-from db.models import User
+from cache import TTLCache
+from db.dals import get_user_dal
+from db.dals import RefreshTokenDAL
+from db.models import UserRow
+from db.session import async_session
 from db.session import get_db
+from db.session import unit_of_work
 from hashing import Hasher
+from hashing import HashingQueueFull
+from security import create_refresh_token
+from security import get_principal_from_claims
+from security import hash_refresh_token
+
+logger = getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login/token")
 
+# user_id -> email закэшированного пользователя, для инвалидации по id
+_principal_emails: dict[UUID, str] = {}
+
+
+def _forget_principal_email(email: str, principal: UserRow) -> None:
+    if _principal_emails.get(principal.user_id) == email:
+        del _principal_emails[principal.user_id]
+
+
+# Кэш пользователей, полученных по subject токена (email)
+principal_cache = TTLCache(
+    "principal",
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    on_evict=_forget_principal_email,
+)
+
+
+# Кэш актуальных версий токенов для проверки токенов с claims
+token_version_cache = TTLCache(
+    "token_version",
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.TOKEN_VERSION_CACHE_TTL_SECONDS,
+)
+
+
+# Кэш проверенных токенов: sha256 токена -> claims, до истечения токена
+verified_token_cache = TTLCache(
+    "verified_token",
+    maxsize=settings.VERIFIED_TOKEN_CACHE_SIZE,
+    ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+
+
+def _decode_token(token: str) -> dict:
+    """Claims of the token, verified once per token while it is valid"""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = verified_token_cache.get(key)
+
+    if payload is None:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+        )
+
+        exp = payload.get("exp")
+        ttl = None if exp is None else exp - time()
+        if ttl is None or ttl > 0:
+            verified_token_cache.set(key, payload, ttl=ttl)
+
+    return payload
+
+
+def _cache_principal(principal: UserRow) -> None:
+    principal_cache.set(principal.email, principal)
+    _principal_emails[principal.user_id] = principal.email
+
+
+def invalidate_cached_principal(user_id: UUID) -> None:
+    """Drop cached user after its data or roles were changed"""
+    token_version_cache.pop(user_id)
+    email = _principal_emails.get(user_id)
+
+    if email is not None:
+        principal_cache.pop(email)
+
+
+async def _get_user_by_email_for_auth(
+    email: str, session: AsyncSession
+) -> Optional[UserRow]:
+    user_dal = get_user_dal(session)
+    return await user_dal.get_auth_user_by_email(email=email)
+
+
+async def _get_token_version(user_id: UUID, session: AsyncSession):
+    token_version = token_version_cache.get(user_id)
+
+    if token_version is None:
+        user_dal = get_user_dal(session)
+        token_version = await user_dal.get_token_version(user_id=user_id)
+
+        if token_version is not None:
+            token_version_cache.set(user_id, token_version)
+
+    return token_version
+
+
+# Ссылки на фоновые задачи, чтобы их не удалил сборщик мусора
+_rehash_tasks: set[asyncio.Task] = set()
+
+
+async def _rehash_password(user_id: UUID, password: str, old_hash: str) -> None:
+    """Store hash of the password made with current scheme and cost"""
+    try:
+        new_hash = await Hasher.get_password_hash_async(password)
+
+        # отдельная сессия: сессия запроса к этому времени уже закрыта
+        async with unit_of_work(async_session) as session:
+            await get_user_dal(session).update_password_hash(
+                user_id=user_id, old_hash=old_hash, new_hash=new_hash
+            )
+    except HashingQueueFull:
+        # пароль будет перехеширован при одном из следующих входов
+        pass
+    except Exception:
+        logger.exception("Password rehash failed for user %s", user_id)
+
 
-async def _get_user_by_email_for_auth(email: str, session: AsyncSession):
-    async with session.begin():
-        user_dal = UserDAL(session)
-        return await user_dal.get_user_by_email(email=email)
+def _schedule_rehash(user_id: UUID, password: str, old_hash: str) -> None:
+    task = asyncio.create_task(_rehash_password(user_id, password, old_hash))
+    _rehash_tasks.add(task)
+    task.add_done_callback(_rehash_tasks.discard)
 
 
 async def authenticate_user(
     email: str, password: str, db: AsyncSession
-) -> Union[User, None]:
+) -> Union[UserRow, None]:
     user = await _get_user_by_email_for_auth(email=email, session=db)
 
     if user is None:
         return
 
-    if not Hasher.verify_password(password, user.hashed_password):
+    # Кроме поиска пользователя логину база не нужна: транзакция
+    # завершается, чтобы не держать соединение во время проверки пароля
+    await db.commit()
+
+    if not await Hasher.verify_password_async(password, user.hashed_password):
         return
 
+    # Пароль известен только при входе, поэтому хеш с устаревшими
+    # параметрами заменяется здесь, не задерживая ответ
+    if Hasher.needs_update(user.hashed_password):
+        _schedule_rehash(user.user_id, password, user.hashed_password)
+
     return user
 
 
+async def _issue_refresh_token(user, session: AsyncSession) -> str:
+    refresh_token = create_refresh_token()
+    expires_at = datetime.now(timezone.utc) + timedelta(
+        days=settings.REFRESH_TOKEN_EXPIRE_DAYS
+    )
+
+    await RefreshTokenDAL(session).create_refresh_token(
+        user_id=user.user_id,
+        token_hash=hash_refresh_token(refresh_token),
+        token_version=user.token_version,
+        expires_at=expires_at,
+    )
+
+    return refresh_token
+
+
+async def _rotate_refresh_token(
+    refresh_token: str, session: AsyncSession
+) -> Optional[tuple[UserRow, str]]:
+    """Exchange the refresh token for a new one.
+
+    Returns the user and the new token or None if the token is not valid.
+    The token is found by the unique index on its hash, password hashing
+    is not involved.
+    """
+    refresh_token_dal = RefreshTokenDAL(session)
+    token_hash = hash_refresh_token(refresh_token)
+
+    user = await refresh_token_dal.revoke_refresh_token(token_hash)
+
+    if user is None:
+        await refresh_token_dal.revoke_all_if_reused(token_hash)
+        # отзыв сохраняется, хотя запрос завершится ошибкой
+        await session.commit()
+        return None
+
+    return user, await _issue_refresh_token(user, session)
+
+
 async def get_current_user_from_token(
     token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
-):
+) -> UserRow:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
     )
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        payload = _decode_token(token)
         email: str = payload.get("sub")
-        print("username/email extracted is ", email)
 
         if email is None:
             raise credentials_exception
@@ -57,9 +227,33 @@ async def get_current_user_from_token(
     except JWTError:
         raise credentials_exception
 
-    user = await _get_user_by_email_for_auth(email=email, session=db)
+    # Токен с claims: пользователь берётся из токена, из базы (или кэша)
+    # читается только версия токена для проверки отзыва
+    if "uid" in payload:
+        principal = get_principal_from_claims(payload)
 
-    if user is None:
+        if principal is None:
+            raise credentials_exception
+
+        token_version = await _get_token_version(principal.user_id, db)
+
+        if token_version is None or token_version != payload.get("ver"):
+            raise credentials_exception
+
+        return principal
+
+    principal = principal_cache.get(email.lower())
+
+    if principal is None:
+        principal = await _get_user_by_email_for_auth(email=email, session=db)
+
+        if principal is None:
+            raise credentials_exception
+
+        _cache_principal(principal)
+
+    # деактивация сбрасывает кэш, поэтому токен отклоняется сразу
+    if not principal.is_active:
         raise credentials_exception
 
-    return user
+    return principal
@@ -1,92 +1,395 @@
+import asyncio
+import csv
+import io
+import json
+import uuid
+from typing import Any
+from typing import AsyncIterator
+from typing import Optional
 from typing import Union
 from uuid import UUID
 
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.engine import Row
+
+import settings
+from api.actions.auth import invalidate_cached_principal
+from api.schemas import BulkCreateUserResult
+from api.schemas import BulkUserResult
 from api.schemas import ShowUser
+from api.schemas import ShowUsersPage
 from api.schemas import UserCreate
-from db.dals import UserDAL
+from db.dals import get_user_dal
+from db.models import ADMIN_ROLES_MASK
 from db.models import PortalRole
+from db.models import roles_from_mask
 from db.models import User
+from db.session import call_after_commit
 from hashing import Hasher
 
 
-async def _create_new_user(body: UserCreate, session) -> ShowUser:
-    async with session.begin():
-        user_dal = UserDAL(session)
+async def _create_new_user(body: UserCreate, session) -> User:
+    # хеширование выполняется в пуле до начала транзакции
+    hashed_password = await Hasher.get_password_hash_async(body.password)
 
-        # создание SQLalchemy-объекта
-        user = await user_dal.create_user(
-            name=body.name,
-            surname=body.surname,
-            email=body.email,
-            hashed_password=Hasher.get_password_hash(body.password),
-            roles=[
-                PortalRole.ROLE_PORTAL_USER,
-            ],
-        )
+    user_dal = get_user_dal(session)
+
+    # создание SQLalchemy-объекта
+    user = await user_dal.create_user(
+        name=body.name,
+        surname=body.surname,
+        email=body.email,
+        hashed_password=hashed_password,
+        role_mask=PortalRole.ROLE_PORTAL_USER.bit,
+    )
+
+    # преобразуется в ShowUser через response_model или api.responses
+    return user
+
+
+async def _hash_passwords(passwords: list[str]) -> list[str]:
+    # Не больше заданий, чем воркеров в пуле: пул не переполняется и
+    # остаётся место для одиночных логинов и регистраций
+    semaphore = asyncio.Semaphore(settings.HASHING_POOL_WORKERS)
+
+    async def hash_password(password: str) -> str:
+        async with semaphore:
+            return await Hasher.get_password_hash_async(password)
+
+    return await asyncio.gather(*(hash_password(p) for p in passwords))
+
+
+async def _create_new_users_bulk(
+    rows: list[Any], session
+) -> list[BulkCreateUserResult]:
+    results: list[BulkCreateUserResult] = []
+    valid_rows: list[tuple[int, UserCreate]] = []
+    seen_emails = set()
 
-        return ShowUser(
-            user_id=user.user_id,
-            name=user.name,
-            surname=user.surname,
-            email=user.email,
-            is_active=user.is_active,
+    for index, row in enumerate(rows):
+        try:
+            body = UserCreate.parse_obj(row)
+        except ValidationError as err:
+            results.append(
+                BulkCreateUserResult(index=index, status="invalid", detail=err.errors())
+            )
+            continue
+        except HTTPException as err:
+            # валидаторы UserCreate сообщают об ошибках через HTTPException
+            results.append(
+                BulkCreateUserResult(index=index, status="invalid", detail=err.detail)
+            )
+            continue
+
+        if body.email in seen_emails:
+            results.append(
+                BulkCreateUserResult(
+                    index=index, status="conflict", detail="Duplicate email in batch."
+                )
+            )
+            continue
+
+        seen_emails.add(body.email)
+        valid_rows.append((index, body))
+
+    # Транзакция, открытая при аутентификации, завершается до хеширования,
+    # чтобы соединение не простаивало в пуле всё время хеширования пакета
+    await session.commit()
+    hashed_passwords = await _hash_passwords([body.password for _, body in valid_rows])
+
+    new_users = [
+        {
+            "user_id": uuid.uuid4(),
+            "name": body.name,
+            "surname": body.surname,
+            "email": body.email,
+            "is_active": True,
+            "hashed_password": hashed_password,
+            "role_mask": PortalRole.ROLE_PORTAL_USER.bit,
+            "token_version": 0,
+            "version": 0,
+        }
+        for (_, body), hashed_password in zip(valid_rows, hashed_passwords)
+    ]
+
+    created = {}
+    chunk_size = settings.BULK_INSERT_CHUNK_SIZE
+    user_dal = get_user_dal(session)
+
+    for start in range(0, len(new_users), chunk_size):
+        created.update(
+            await user_dal.create_users_bulk(new_users[start : start + chunk_size])
         )
 
+    for index, body in valid_rows:
+        if body.email in created:
+            results.append(
+                BulkCreateUserResult(
+                    index=index, status="created", user_id=created[body.email]
+                )
+            )
+        else:
+            results.append(
+                BulkCreateUserResult(
+                    index=index,
+                    status="conflict",
+                    detail=f"User with email {body.email} already exists.",
+                )
+            )
+
+    return sorted(results, key=lambda result: result.index)
+
+
+async def _delete_user_authorized(user_id, current_user, session) -> Optional[Row]:
+    user_dal = get_user_dal(session)
 
-async def _delete_user(user_id, session) -> Union[UUID, None]:
-    async with session.begin():
-        user_dal = UserDAL(session)
+    result = await user_dal.delete_user_authorized(
+        user_id=user_id, current_user=current_user
+    )
 
-        deleted_user_id = await user_dal.delete_user(user_id=user_id)
+    if result is not None and result.written_user_id is not None:
+        call_after_commit(session, invalidate_cached_principal, user_id)
 
-        return deleted_user_id
+    return result
+
+
+async def _delete_users_authorized(
+    user_ids: list[UUID], current_user, session
+) -> list[BulkUserResult]:
+    """Deactivate all permitted users with one statement.
+
+    Statuses: deactivated, forbidden, not_found and already_inactive.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    user_dal = get_user_dal(session)
+
+    rows = await user_dal.delete_users_authorized(
+        user_ids=user_ids, current_user=current_user
+    )
+    rows_by_id = {row.user_id: row for row in rows}
+    results = []
+
+    for user_id in user_ids:
+        row = rows_by_id.get(user_id)
+
+        if row is None:
+            status = "not_found"
+        elif row.written_user_id is not None:
+            status = "deactivated"
+            call_after_commit(session, invalidate_cached_principal, user_id)
+        elif not check_user_permissions(target_user=row, current_user=current_user) or (
+            row.role_mask & PortalRole.ROLE_PORTAL_SUPERADMIN.bit
+        ):
+            status = "forbidden"
+        else:
+            status = "already_inactive"
+
+        results.append(BulkUserResult(user_id=user_id, status=status))
+
+    return results
 
 
 async def _update_user(
     updated_user_params: dict, user_id: UUID, session
 ) -> Union[UUID, None]:
-    async with session.begin():
-        user_dal = UserDAL(session)
+    user_dal = get_user_dal(session)
+
+    updated_user_id = await user_dal.update_user(user_id=user_id, **updated_user_params)
+
+    # также покрывает выдачу и отзыв прав администратора
+    call_after_commit(session, invalidate_cached_principal, user_id)
+
+    return updated_user_id
+
+
+async def _update_user_authorized(
+    updated_user_params: dict,
+    user_id: UUID,
+    current_user,
+    session,
+    expected_versions: Optional[list[int]] = None,
+) -> Optional[Row]:
+    user_dal = get_user_dal(session)
+
+    result = await user_dal.update_user_authorized(
+        user_id=user_id,
+        current_user=current_user,
+        expected_versions=expected_versions,
+        **updated_user_params,
+    )
+
+    if result is not None and result.written_user_id is not None:
+        call_after_commit(session, invalidate_cached_principal, user_id)
+
+    return result
 
-        updated_user_id = await user_dal.update_user(
-            user_id=user_id, **updated_user_params
-        )
 
-        return updated_user_id
+async def _change_admin_role_bulk(
+    user_ids: list[UUID], current_user, session, grant: bool
+) -> list[BulkUserResult]:
+    """Grant or revoke admin role of all users with one statement.
+
+    Statuses: granted / revoked, already_admin / not_admin, inactive,
+    not_found, and forbidden for current_user itself.
+    """
+    # дубликаты обрабатываются один раз, порядок сохраняется
+    user_ids = list(dict.fromkeys(user_ids))
+    user_dal = get_user_dal(session)
+
+    if grant:
+        rows = await user_dal.grant_admin_bulk(user_ids, current_user.user_id)
+        done_status, unchanged_status = "granted", "already_admin"
+    else:
+        rows = await user_dal.revoke_admin_bulk(user_ids, current_user.user_id)
+        done_status, unchanged_status = "revoked", "not_admin"
+
+    rows_by_id = {row.user_id: row for row in rows}
+    results = []
+
+    for user_id in user_ids:
+        row = rows_by_id.get(user_id)
+
+        if user_id == current_user.user_id:
+            status = "forbidden"
+        elif row is None:
+            status = "not_found"
+        elif row.written_user_id is not None:
+            status = done_status
+            call_after_commit(session, invalidate_cached_principal, user_id)
+        elif not row.is_active:
+            status = "inactive"
+        else:
+            status = unchanged_status
+
+        results.append(BulkUserResult(user_id=user_id, status=status))
+
+    return results
 
 
 async def _get_user_by_id(user_id, session) -> Union[User, None]:
-    async with session.begin():
-        user_dal = UserDAL(session)
+    user_dal = get_user_dal(session)
+
+    user = await user_dal.get_user_by_id(user_id=user_id)
+
+    if user is not None:
+        return user
+
+
+async def _get_user_version(user_id, session) -> Optional[int]:
+    user_dal = get_user_dal(session)
+
+    return await user_dal.get_user_version(user_id=user_id)
+
+
+async def _get_users_page(
+    session,
+    limit: int,
+    after: Optional[UUID] = None,
+    is_active: Optional[bool] = None,
+    role: Optional[PortalRole] = None,
+) -> tuple[list[User], Optional[UUID]]:
+    """Users of the page and user_id to continue from, if there are more"""
+    user_dal = get_user_dal(session)
+
+    # лишняя строка показывает, есть ли следующая страница
+    users = await user_dal.list_users(
+        limit=limit + 1, after=after, is_active=is_active, role=role
+    )
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = users[-1].user_id
+
+    return users, next_cursor
+
 
-        user = await user_dal.get_user_by_id(user_id=user_id)
+async def _list_users(
+    session,
+    limit: int,
+    after: Optional[UUID] = None,
+    is_active: Optional[bool] = None,
+    role: Optional[PortalRole] = None,
+) -> ShowUsersPage:
+    users, next_cursor = await _get_users_page(
+        session, limit=limit, after=after, is_active=is_active, role=role
+    )
 
-        if user is not None:
-            return user
+    return ShowUsersPage(
+        users=[ShowUser.from_orm(user) for user in users], next_cursor=next_cursor
+    )
+
+
+EXPORT_FIELDS = ["user_id", "name", "surname", "email", "is_active", "roles"]
+
+
+def _format_rows_ndjson(rows) -> bytes:
+    lines = [
+        json.dumps(
+            {
+                "user_id": str(row.user_id),
+                "name": row.name,
+                "surname": row.surname,
+                "email": row.email,
+                "is_active": row.is_active,
+                "roles": roles_from_mask(row.role_mask),
+            },
+            ensure_ascii=False,
+        )
+        for row in rows
+    ]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _format_rows_csv(rows, with_header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if with_header:
+        writer.writerow(EXPORT_FIELDS)
+
+    for row in rows:
+        writer.writerow(
+            [
+                row.user_id,
+                row.name,
+                row.surname,
+                row.email,
+                row.is_active,
+                ";".join(roles_from_mask(row.role_mask)),
+            ]
+        )
+    return buffer.getvalue().encode()
+
+
+async def _export_users(session, export_format: str) -> AsyncIterator[bytes]:
+    """Yield users table as NDJSON or CSV chunks, one chunk per batch"""
+    # Серверный курсор работает внутри транзакции сессии и видит один
+    # снимок данных на всё время выгрузки
+    user_dal = get_user_dal(session)
+    with_header = True
+
+    async for rows in user_dal.stream_users(settings.EXPORT_BATCH_SIZE):
+        if export_format == "csv":
+            yield _format_rows_csv(rows, with_header=with_header)
+            with_header = False
+        else:
+            yield _format_rows_ndjson(rows)
+
+    if export_format == "csv" and with_header:
+        yield _format_rows_csv([], with_header=True)
 
 
 def check_user_permissions(target_user: User, current_user: User) -> bool:
     if target_user.user_id != current_user.user_id:
 
         # ceck admin role
-        if not {
-            PortalRole.ROLE_PORTAL_ADMIN,
-            PortalRole.ROLE_PORTAL_SUPERADMIN,
-        }.intersection(current_user.roles):
+        if not current_user.role_mask & ADMIN_ROLES_MASK:
             return False
 
-        # check admin deactivate superadmin attempt
-        if (
-            PortalRole.ROLE_PORTAL_SUPERADMIN in target_user.roles
-            and PortalRole.ROLE_PORTAL_ADMIN in current_user.roles
-        ):
-            return False
-
-        # check admin deactivate admin attempt
-        if (
-            PortalRole.ROLE_PORTAL_ADMIN in target_user.roles
-            and PortalRole.ROLE_PORTAL_ADMIN in current_user.roles
-        ):
+        # check admin deactivate admin or superadmin attempt
+        if current_user.is_admin and target_user.role_mask & ADMIN_ROLES_MASK:
             return False
 
     return True
@@ -1,40 +1,173 @@
+import json
 from logging import getLogger
+from typing import Any
+from typing import Optional
 from uuid import UUID
 
 from fastapi import APIRouter
 from fastapi import Depends
+from fastapi import Header
 from fastapi import HTTPException
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import settings
 from api.actions.auth import get_current_user_from_token
+from api.actions.user import _change_admin_role_bulk
 from api.actions.user import _create_new_user
-from api.actions.user import _delete_user
+from api.actions.user import _create_new_users_bulk
+from api.actions.user import _delete_user_authorized
+from api.actions.user import _delete_users_authorized
+from api.actions.user import _export_users
 from api.actions.user import _get_user_by_id
+from api.actions.user import _get_user_version
+from api.actions.user import _get_users_page
+from api.actions.user import _list_users
 from api.actions.user import _update_user
+from api.actions.user import _update_user_authorized
 from api.actions.user import check_user_permissions
+from api.responses import etag_matches
+from api.responses import etag_versions
+from api.responses import user_etag
+from api.responses import user_response
+from api.responses import users_page_response
+from api.schemas import BulkCreateUsersResponse
+from api.schemas import BulkDeleteUsersResponse
+from api.schemas import BulkUserIdsRequest
+from api.schemas import BulkUsersUpdateResponse
 from api.schemas import DeleteUserResponse
 from api.schemas import ShowUser
+from api.schemas import ShowUsersPage
 from api.schemas import UpdatedUserResponse
 from api.schemas import UpdateUserRequest
 from api.schemas import UserCreate
 from db.models import PortalRole
 from db.models import User
 from db.session import get_db
+from db.session import UnitOfWorkRoute
 
 
 logger = getLogger(__name__)
 
-user_router = APIRouter()
+user_router = APIRouter(route_class=UnitOfWorkRoute)
 
 
 @user_router.post("/", response_model=ShowUser)
 async def create_user(body: UserCreate, db: AsyncSession = Depends(get_db)) -> ShowUser:
     try:
-        return await _create_new_user(body, db)
+        user = await _create_new_user(body, db)
     except IntegrityError as err:
         logger.error(err)
-        raise HTTPException(status_code=503, detail=f"Database error: {err}")
+        raise HTTPException(status_code=503, detail="Database error, try again later.")
+
+    if settings.FAST_JSON_RESPONSES:
+        return user_response(user)
+
+    return user
+
+
+async def _read_bulk_rows(request: Request) -> list[Any]:
+    """Read JSON array or NDJSON (one user per line) from the request body"""
+    invalid_body_exception = HTTPException(
+        status_code=422, detail="Body should be a JSON array or NDJSON."
+    )
+    too_many_rows_exception = HTTPException(
+        status_code=413,
+        detail=f"At most {settings.BULK_CREATE_MAX_ROWS} users per request.",
+    )
+
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        rows = []
+        buffer = b""
+
+        # тело читается по частям, строки разбираются по мере поступления
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+
+            for line in lines:
+                if not line.strip():
+                    continue
+                if len(rows) >= settings.BULK_CREATE_MAX_ROWS:
+                    raise too_many_rows_exception
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    raise invalid_body_exception
+
+        if buffer.strip():
+            try:
+                rows.append(json.loads(buffer))
+            except ValueError:
+                raise invalid_body_exception
+    else:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise invalid_body_exception
+
+        if not isinstance(rows, list):
+            raise invalid_body_exception
+
+    if len(rows) > settings.BULK_CREATE_MAX_ROWS:
+        raise too_many_rows_exception
+
+    return rows
+
+
+@user_router.post("/bulk", response_model=BulkCreateUsersResponse)
+async def create_users_bulk(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> BulkCreateUsersResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+
+    rows = await _read_bulk_rows(request)
+
+    try:
+        results = await _create_new_users_bulk(rows, db)
+    except IntegrityError as err:
+        logger.error(err)
+        raise HTTPException(status_code=503, detail="Database error, try again later.")
+
+    return BulkCreateUsersResponse(
+        created=sum(result.status == "created" for result in results),
+        results=results,
+    )
+
+
+def _check_bulk_user_ids(body: BulkUserIdsRequest) -> None:
+    if not body.user_ids:
+        raise HTTPException(status_code=422, detail="user_ids should not be empty.")
+
+    if len(body.user_ids) > settings.BULK_UPDATE_MAX_IDS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_UPDATE_MAX_IDS} users per request.",
+        )
+
+
+@user_router.delete("/bulk", response_model=BulkDeleteUsersResponse)
+async def delete_users_bulk(
+    body: BulkUserIdsRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> BulkDeleteUsersResponse:
+    _check_bulk_user_ids(body)
+
+    # права проверяются для всех пользователей в одном UPDATE
+    results = await _delete_users_authorized(body.user_ids, current_user, db)
+
+    return BulkDeleteUsersResponse(
+        deactivated=sum(result.status == "deactivated" for result in results),
+        results=results,
+    )
 
 
 @user_router.delete("/", response_model=DeleteUserResponse)
@@ -44,32 +177,29 @@ async def delete_user(
     current_user: User = Depends(get_current_user_from_token),
 ) -> DeleteUserResponse:
 
-    user_for_deletion = await _get_user_by_id(user_id, db)
+    # права проверяются в том же запросе, который деактивирует пользователя
+    result = await _delete_user_authorized(user_id, current_user, db)
 
-    if user_for_deletion is None:
+    if result is None:
         raise HTTPException(
             status_code=404, detail=f"User with id {user_id} not found."
         )
 
-    if not check_user_permissions(
-        target_user=user_for_deletion,
-        current_user=current_user,
-    ):
-        raise HTTPException(status_code=403, detail="Forbidden.")
-
-    if PortalRole.ROLE_PORTAL_SUPERADMIN in user_for_deletion.roles:
-        raise HTTPException(
-            status_code=406, detail="Superadmin cannot be deleted via API."
-        )
+    if result.written_user_id is None:
+        if not check_user_permissions(target_user=result, current_user=current_user):
+            raise HTTPException(status_code=403, detail="Forbidden.")
 
-    deleted_user_id = await _delete_user(user_id, db)
+        if result.role_mask & PortalRole.ROLE_PORTAL_SUPERADMIN.bit:
+            raise HTTPException(
+                status_code=406, detail="Superadmin cannot be deleted via API."
+            )
 
-    if deleted_user_id is None:
+        # пользователь уже деактивирован
         raise HTTPException(
             status_code=404, detail=f"User with id {user_id} not found."
         )
 
-    return DeleteUserResponse(deleted_user_id=deleted_user_id)
+    return DeleteUserResponse(deleted_user_id=result.written_user_id)
 
 
 @user_router.patch("/admin_privilege", response_model=UpdatedUserResponse)
@@ -100,7 +230,7 @@ async def grant_admin_privilege(
         )
 
     updated_user_params = {
-        "roles": user_for_promotion.enrich_admin_roles_by_admin_role()
+        "role_mask": user_for_promotion.enrich_admin_roles_by_admin_role()
     }
 
     try:
@@ -109,7 +239,7 @@ async def grant_admin_privilege(
         )
     except IntegrityError as err:
         logger.error(err)
-        raise HTTPException(status_code=503, detail=f"Database error: {err}")
+        raise HTTPException(status_code=503, detail="Database error, try again later.")
 
     return UpdatedUserResponse(updated_user_id=updated_user_id)
 
@@ -141,7 +271,9 @@ async def revoke_admin_privilege(
         )
 
     updated_user_params = {
-        "roles": user_for_revoke_admin_privileges.remove_admin_privileges_from_model()
+        "role_mask": (
+            user_for_revoke_admin_privileges.remove_admin_privileges_from_model()
+        )
     }
 
     try:
@@ -150,17 +282,69 @@ async def revoke_admin_privilege(
         )
     except IntegrityError as err:
         logger.error(err)
-        raise HTTPException(status_code=503, detail=f"Database error: {err}")
+        raise HTTPException(status_code=503, detail="Database error, try again later.")
 
     return UpdatedUserResponse(updated_user_id=updated_user_id)
 
 
-@user_router.get("/", response_model=ShowUser)
+@user_router.patch("/admin_privilege/bulk", response_model=BulkUsersUpdateResponse)
+async def grant_admin_privilege_bulk(
+    body: BulkUserIdsRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> BulkUsersUpdateResponse:
+    if not current_user.is_superadmin:
+        raise HTTPException(status_code=403, detail="Forbidden.")
+
+    _check_bulk_user_ids(body)
+
+    # права выдаются одним UPDATE ... WHERE user_id = ANY(...)
+    results = await _change_admin_role_bulk(
+        body.user_ids, current_user=current_user, session=db, grant=True
+    )
+    return BulkUsersUpdateResponse(
+        updated=sum(result.status == "granted" for result in results),
+        results=results,
+    )
+
+
+@user_router.delete("/admin_privilege/bulk", response_model=BulkUsersUpdateResponse)
+async def revoke_admin_privilege_bulk(
+    body: BulkUserIdsRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> BulkUsersUpdateResponse:
+    if not current_user.is_superadmin:
+        raise HTTPException(status_code=403, detail="Forbidden.")
+
+    _check_bulk_user_ids(body)
+
+    results = await _change_admin_role_bulk(
+        body.user_ids, current_user=current_user, session=db, grant=False
+    )
+    return BulkUsersUpdateResponse(
+        updated=sum(result.status == "revoked" for result in results),
+        results=results,
+    )
+
+
+@user_router.get(
+    "/", response_model=ShowUser, responses={304: {"description": "Not Modified"}}
+)
 async def get_user_by_id(
     user_id: UUID,
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token),
 ) -> ShowUser:
+    if if_none_match is not None:
+        # версия читается без строки пользователя и без сериализации ответа
+        version = await _get_user_version(user_id, db)
+
+        if version is not None and etag_matches(if_none_match, user_etag(version)):
+            return Response(status_code=304, headers={"ETag": user_etag(version)})
+
     user = await _get_user_by_id(user_id, db)
 
     if user is None:
@@ -168,13 +352,70 @@ async def get_user_by_id(
             status_code=404, detail=f"User with id {user_id} not found."
         )
 
+    if settings.FAST_JSON_RESPONSES:
+        fast_response = user_response(user)
+        fast_response.headers["ETag"] = user_etag(user.version)
+        return fast_response
+
+    response.headers["ETag"] = user_etag(user.version)
     return user
 
 
+@user_router.get("/list", response_model=ShowUsersPage)
+async def list_users(
+    limit: int = Query(default=50, ge=1, le=settings.USER_LIST_MAX_LIMIT),
+    after: Optional[UUID] = None,
+    is_active: Optional[bool] = None,
+    role: Optional[PortalRole] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> ShowUsersPage:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+
+    if settings.FAST_JSON_RESPONSES:
+        users, next_cursor = await _get_users_page(
+            db, limit=limit, after=after, is_active=is_active, role=role
+        )
+        return users_page_response(users, next_cursor)
+
+    return await _list_users(
+        db, limit=limit, after=after, is_active=is_active, role=role
+    )
+
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+@user_router.get("/export")
+async def export_users(
+    export_format: str = Query(
+        default="ndjson", alias="format", regex="^(ndjson|csv)$"
+    ),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> StreamingResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+
+    # Очередная порция читается из курсора только после отправки
+    # предыдущей, поэтому медленный клиент замедляет чтение из базы.
+    # Сессия закрывается зависимостью get_db после отправки ответа.
+    return StreamingResponse(
+        _export_users(db, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="users.{export_format}"'
+        },
+    )
+
+
 @user_router.patch("/", response_model=UpdatedUserResponse)
 async def update_user_by_id(
     user_id: UUID,
     body: UpdateUserRequest,
+    response: Response,
+    if_match: Optional[str] = Header(default=None),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token),
 ) -> UpdatedUserResponse:
@@ -189,25 +430,43 @@ async def update_user_by_id(
 should be provided",
         )
 
-    user_for_update = await _get_user_by_id(user_id, db)
+    # версия сравнивается в том же UPDATE, блокировки не нужны
+    expected_versions = etag_versions(if_match) if if_match is not None else None
+
+    try:
+        # права проверяются в том же запросе, который изменяет пользователя
+        result = await _update_user_authorized(
+            updated_user_params=updated_user_params,
+            user_id=user_id,
+            current_user=current_user,
+            session=db,
+            expected_versions=expected_versions,
+        )
+
+    except IntegrityError as err:
+        logger.error(err)
+        raise HTTPException(status_code=503, detail="Database error, try again later.")
 
-    if user_for_update is None:
+    if result is None:
         raise HTTPException(
             status_code=404, detail=f"User with id {user_id} not found."
         )
 
-    if not check_user_permissions(
-        target_user=user_for_update, current_user=current_user
-    ):
-        raise HTTPException(status_code=403, detail="Forbidden.")
+    if result.written_user_id is None:
+        if not check_user_permissions(target_user=result, current_user=current_user):
+            raise HTTPException(status_code=403, detail="Forbidden.")
 
-    try:
-        updated_user_id = await _update_user(
-            updated_user_params=updated_user_params, session=db, user_id=user_id
-        )
+        if not result.is_active:
+            raise HTTPException(
+                status_code=404, detail=f"User with id {user_id} not found."
+            )
 
-    except IntegrityError as err:
-        logger.error(err)
-        raise HTTPException(status_code=503, detail=f"Database error: {err}")
+        # пользователь изменён после получения ETag клиентом
+        raise HTTPException(
+            status_code=412,
+            detail="User was modified, fetch it again.",
+            headers={"ETag": user_etag(result.version)},
+        )
 
-    return UpdatedUserResponse(updated_user_id=updated_user_id)
+    response.headers["ETag"] = user_etag(result.written_version)
+    return UpdatedUserResponse(updated_user_id=result.written_user_id)
@@ -2,20 +2,39 @@ from datetime import timedelta
 
 from fastapi import APIRouter
 from fastapi import Depends
+from fastapi import Form
 from fastapi import HTTPException
 from fastapi import status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import settings
+from api.actions.auth import _issue_refresh_token
+from api.actions.auth import _rotate_refresh_token
 from api.actions.auth import authenticate_user
 from api.schemas import Token
 from db.session import get_db
+from db.session import UnitOfWorkRoute
 from security import create_access_token
+from security import get_user_claims
 
 
 # Создание маршрутов для аутентификации пользователей
-login_router = APIRouter()
+login_router = APIRouter(route_class=UnitOfWorkRoute)
+
+
+def _create_access_token_for_user(user) -> str:
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+
+    if settings.JWT_SELF_CONTAINED_CLAIMS:
+        token_data = get_user_claims(user)
+    else:
+        token_data = {"sub": user.email, "other_custom_data": [1, 2, 3, 4]}
+
+    return create_access_token(
+        data=token_data,
+        expires_delta=access_token_expires,
+    )
 
 
 @login_router.post("/token", response_model=Token)
@@ -31,11 +50,31 @@ async def login_for_access_token(
             detail="Incorrect username or password",
         )
 
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return {
+        "access_token": _create_access_token_for_user(user),
+        "token_type": "bearer",
+        "refresh_token": await _issue_refresh_token(user, db),
+    }
 
-    access_token = create_access_token(
-        data={"sub": user.email, "other_custom_data": [1, 2, 3, 4]},
-        expires_delta=access_token_expires,
-    )
 
-    return {"access_token": access_token, "token_type": "bearer"}
+@login_router.post("/refresh", response_model=Token)
+async def refresh_access_token(
+    refresh_token: str = Form(), db: AsyncSession = Depends(get_db)
+):
+    # Новый access-токен выдаётся без проверки пароля; использованный
+    # refresh-токен отзывается и заменяется новым
+    result = await _rotate_refresh_token(refresh_token, db)
+
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+        )
+
+    user, new_refresh_token = result
+
+    return {
+        "access_token": _create_access_token_for_user(user),
+        "token_type": "bearer",
+        "refresh_token": new_refresh_token,
+    }
@@ -0,0 +1,72 @@
+"""Fast rendering of user responses.
+
+When FAST_JSON_RESPONSES is set the /user handlers return these responses
+instead of data for response_model: FastAPI does not validate and convert
+returned Response objects, so rows are encoded straight to bytes by orjson.
+"""
+from typing import Any
+from typing import Iterable
+from typing import Optional
+from uuid import UUID
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+class UserJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        # asyncpg возвращает свой подкласс UUID, а orjson кодирует только
+        # точный uuid.UUID; остальное приводится к строке
+        return orjson.dumps(content, default=str)
+
+
+def user_etag(version: int) -> str:
+    """Strong ETag of the user representation by version of its row"""
+    return f'"{version}"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Check If-None-Match / If-Match header value against the ETag"""
+    if header is None:
+        return False
+
+    tags = {tag.strip() for tag in header.split(",")}
+    # для If-None-Match допускается слабое сравнение (RFC 9110, 13.1.2)
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def etag_versions(header: str) -> Optional[list[int]]:
+    """Versions of strong ETags in If-Match header, None for any version"""
+    tags = [tag.strip() for tag in header.split(",")]
+    if "*" in tags:
+        return None
+
+    # If-Match использует строгое сравнение: слабые ETag не совпадают
+    return [
+        int(tag[1:-1])
+        for tag in tags
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit()
+    ]
+
+
+def user_to_dict(user) -> dict:
+    """ShowUser fields of User, UserRow or Row"""
+    return {
+        "user_id": user.user_id,
+        "name": user.name,
+        "surname": user.surname,
+        "email": user.email,
+        "is_active": user.is_active,
+    }
+
+
+def user_response(user) -> UserJSONResponse:
+    return UserJSONResponse(user_to_dict(user))
+
+
+def users_page_response(
+    users: Iterable, next_cursor: Optional[UUID]
+) -> UserJSONResponse:
+    return UserJSONResponse(
+        {"users": [user_to_dict(user) for user in users], "next_cursor": next_cursor}
+    )
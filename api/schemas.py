@@ -1,5 +1,6 @@
 import re
 import uuid
+from typing import Any
 from typing import Optional
 
 from fastapi import HTTPException
@@ -30,12 +31,25 @@ class ShowUser(TunedModel):
     is_active: bool
 
 
+class ShowUsersPage(BaseModel):
+    users: list[ShowUser]
+    # user_id, после которого начинается следующая страница
+    next_cursor: Optional[uuid.UUID]
+
+
+def normalize_email(value: str) -> str:
+    """Emails are stored in lower case, so lookups by email ignore case"""
+    return value.lower()
+
+
 class UserCreate(BaseModel):
     name: str
     surname: str
     email: EmailStr
     password: str
 
+    _normalize_email = validator("email", allow_reuse=True)(normalize_email)
+
     @validator("name")
     def validate_name(cls, value):
 
@@ -57,6 +71,41 @@ class UserCreate(BaseModel):
         return value
 
 
+class BulkCreateUserResult(BaseModel):
+    # номер строки во входных данных
+    index: int
+    # created / invalid / conflict
+    status: str
+    user_id: Optional[uuid.UUID]
+    detail: Optional[Any]
+
+
+class BulkCreateUsersResponse(BaseModel):
+    created: int
+    results: list[BulkCreateUserResult]
+
+
+class BulkUserIdsRequest(BaseModel):
+    user_ids: list[uuid.UUID]
+
+
+class BulkUserResult(BaseModel):
+    user_id: uuid.UUID
+    status: str
+
+
+class BulkUsersUpdateResponse(BaseModel):
+    # число изменённых пользователей
+    updated: int
+    results: list[BulkUserResult]
+
+
+class BulkDeleteUsersResponse(BaseModel):
+    # число деактивированных пользователей
+    deactivated: int
+    results: list[BulkUserResult]
+
+
 class DeleteUserResponse(BaseModel):
     deleted_user_id: uuid.UUID
 
@@ -70,6 +119,8 @@ class UpdateUserRequest(BaseModel):
     surname: Optional[constr(min_length=1)]
     email: Optional[EmailStr]
 
+    _normalize_email = validator("email", allow_reuse=True)(normalize_email)
+
     @validator("name")
     def validate_name(cls, value):
         if not LETTER_MATCH_PATTERN.match(value):
@@ -92,3 +143,4 @@ class UpdateUserRequest(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
@@ -0,0 +1,106 @@
+"""Compare per-call latency and CPU time of UserDAL backends.
+
+Seeds users into the database from REAL_DATABASE_URL (or --url), runs the
+hot read methods of UserDAL and AsyncpgUserDAL and removes the seeded users.
+
+Usage: python -m bench.dal_backends --users 1000 --calls 5000
+"""
+import argparse
+import asyncio
+import statistics
+from time import perf_counter
+from time import process_time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import settings
+from bench.seed import connect
+from bench.seed import remove_users
+from bench.seed import seed_users
+from bench.seed import SeedUser
+from db.dals import AsyncpgUserDAL
+from db.dals import UserDAL
+
+EMAIL_DOMAIN = "dal-bench.example.com"
+BACKENDS = {"orm": UserDAL, "asyncpg": AsyncpgUserDAL}
+
+
+async def measure(session_factory, dal_class, method: str, users, calls: int):
+    latencies = []
+    async with session_factory() as session:
+        dal = dal_class(session)
+        cpu_start = process_time()
+
+        for number in range(calls):
+            user = users[number % len(users)]
+            start = perf_counter()
+            if method == "get_auth_user_by_email":
+                await dal.get_auth_user_by_email(user.email)
+            elif method == "get_user_by_id":
+                await dal.get_user_by_id(user.user_id)
+            else:
+                await dal.get_token_version(user.user_id)
+            latencies.append(perf_counter() - start)
+
+            # ORM держит загруженные объекты в identity map сессии
+            session.expunge_all()
+
+        cpu = process_time() - cpu_start
+        await session.rollback()
+
+    latencies.sort()
+    return {
+        "mean_us": statistics.mean(latencies) * 1e6,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "cpu_us_per_call": cpu / calls * 1e6,
+    }
+
+
+async def run(url: str, users_count: int, calls: int) -> None:
+    engine = create_async_engine(url, future=True)
+    session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+    connection = await connect(url)
+    users = [SeedUser(f"user{number}@{EMAIL_DOMAIN}") for number in range(users_count)]
+    await remove_users(connection, EMAIL_DOMAIN)
+    await seed_users(connection, users, hashed_password="-")
+    try:
+        print(
+            f"{'method':<24}{'backend':<10}{'mean us':>10}{'p50 us':>10}"
+            f"{'p99 us':>10}{'cpu us':>10}"
+        )
+        for method in (
+            "get_auth_user_by_email",
+            "get_user_by_id",
+            "get_token_version",
+        ):
+            for name, dal_class in BACKENDS.items():
+                # прогрев: соединение и подготовленные запросы
+                await measure(session_factory, dal_class, method, users, 100)
+                result = await measure(session_factory, dal_class, method, users, calls)
+                print(
+                    f"{method:<24}{name:<10}{result['mean_us']:>10.1f}"
+                    f"{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}"
+                    f"{result['cpu_us_per_call']:>10.1f}"
+                )
+    finally:
+        await remove_users(connection, EMAIL_DOMAIN)
+        await connection.close()
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark UserDAL backends")
+    parser.add_argument("--url", default=settings.REAL_DATABASE_URL)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.users, args.calls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compare the auth lookup by email with the full row lookup on a large table.
+
+Seeds users into the database from REAL_DATABASE_URL (or --url), vacuums
+the table so the visibility map allows index-only scans, prints the plans
+of both queries and their per-call latency, then removes the seeded users.
+
+Usage: python -m bench.email_lookup --users 1000000 --lookups 10000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+from time import perf_counter
+
+import settings
+from bench.seed import connect
+from bench.seed import remove_users
+from bench.seed import seed_users
+from bench.seed import SeedUser
+from db.models import AUTH_COLUMNS
+
+EMAIL_DOMAIN = "email-bench.example.com"
+SEED_CHUNK_SIZE = 100000
+
+QUERIES = {
+    "full row": "SELECT * FROM users WHERE email = $1",
+    "auth columns": (
+        f"SELECT email, {', '.join(AUTH_COLUMNS)} FROM users WHERE email = $1"
+    ),
+}
+
+
+def email(number: int) -> str:
+    return f"user{number}@{EMAIL_DOMAIN}"
+
+
+async def seed(connection, count: int) -> None:
+    for start in range(0, count, SEED_CHUNK_SIZE):
+        users = [
+            SeedUser(email(number))
+            for number in range(start, min(start + SEED_CHUNK_SIZE, count))
+        ]
+        await seed_users(connection, users, hashed_password="-" * 60)
+        print(f"seeded {start + len(users)} users")
+
+
+async def explain(connection, query: str) -> str:
+    rows = await connection.fetch(
+        f"EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) {query}", email(0)
+    )
+    return "\n".join(row[0] for row in rows)
+
+
+async def measure(connection, query: str, emails: list[str]) -> dict:
+    statement = await connection.prepare(query)
+    latencies = []
+
+    for value in emails:
+        start = perf_counter()
+        await statement.fetchrow(value)
+        latencies.append(perf_counter() - start)
+
+    latencies.sort()
+    return {
+        "mean_us": statistics.mean(latencies) * 1e6,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+    }
+
+
+async def run(url: str, users_count: int, lookups: int) -> None:
+    connection = await connect(url)
+    await remove_users(connection, EMAIL_DOMAIN)
+    try:
+        await seed(connection, users_count)
+        # index-only scan читает heap для страниц, не отмеченных в visibility map
+        await connection.execute("VACUUM ANALYZE users")
+
+        for name, query in QUERIES.items():
+            print(f"\n{name}:\n{await explain(connection, query)}")
+
+        emails = [email(random.randrange(users_count)) for _ in range(lookups)]
+        print(f"\n{'query':<16}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+        for name, query in QUERIES.items():
+            # прогрев: подготовка запроса и кэш страниц
+            await measure(connection, query, emails[:100])
+            result = await measure(connection, query, emails)
+            print(
+                f"{name:<16}{result['mean_us']:>10.1f}"
+                f"{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}"
+            )
+    finally:
+        await remove_users(connection, EMAIL_DOMAIN)
+        await connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark email lookups")
+    parser.add_argument("--url", default=settings.REAL_DATABASE_URL)
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.users, args.lookups))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""Load generator for a running instance of the service.
+
+Seeds users directly into the database of the instance, drives a weighted
+mix of requests from concurrent clients and reports throughput, latency
+percentiles and error rate per route. Results are also written as JSON,
+so runs can be compared.
+
+Usage (with the service started by python main.py):
+python -m bench.load --mix mixed --concurrency 50 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import string
+import subprocess
+from collections import defaultdict
+from datetime import datetime
+from time import monotonic
+from time import perf_counter
+from typing import Optional
+
+import httpx
+
+import settings
+from bench.seed import connect
+from bench.seed import remove_users
+from bench.seed import seed_users
+from bench.seed import SeedUser
+from db.models import PortalRole
+from hashing import Hasher
+
+EMAIL_DOMAIN = "load-bench.example.com"
+PASSWORD = "LoadBench1!"
+
+# Доли маршрутов в нагрузке
+MIXES = {
+    "read": {"get": 90, "patch": 5, "login": 5},
+    "auth": {"login": 60, "refresh": 20, "get": 20},
+    "mixed": {
+        "login": 10,
+        "refresh": 5,
+        "get": 50,
+        "patch": 20,
+        "delete": 5,
+        "grant_admin": 5,
+        "revoke_admin": 5,
+    },
+}
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def random_name() -> str:
+    return "".join(random.choices(string.ascii_letters, k=8))
+
+
+class LoadState:
+    """Seeded users, their tokens and per-route measurements"""
+
+    def __init__(self, clients: list[SeedUser], superadmin: SeedUser, targets):
+        self.clients = clients
+        self.superadmin = superadmin
+        # пользователи для деактивации, каждый используется один раз
+        self.delete_targets = list(targets["delete"])
+        # пользователи для выдачи и отзыва прав администратора
+        self.not_admins = list(targets["roles"])
+        self.admins: list[SeedUser] = []
+        self.tokens: dict[str, str] = {}
+        self.refresh_tokens: dict[str, str] = {}
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.statuses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def headers(self, user: SeedUser) -> dict:
+        return {"Authorization": f"Bearer {self.tokens.get(user.email, '')}"}
+
+
+async def login(http: httpx.AsyncClient, state: LoadState, user: SeedUser):
+    resp = await http.post(
+        "/login/token", data={"username": user.email, "password": PASSWORD}
+    )
+    if resp.status_code == 200:
+        state.tokens[user.email] = resp.json()["access_token"]
+        state.refresh_tokens[user.email] = resp.json().get("refresh_token")
+    return resp
+
+
+async def do_login(http, state: LoadState) -> Optional[httpx.Response]:
+    return await login(http, state, random.choice(state.clients))
+
+
+async def do_refresh(http, state: LoadState) -> Optional[httpx.Response]:
+    user = random.choice(state.clients)
+    refresh_token = state.refresh_tokens.pop(user.email, None)
+    if refresh_token is None:
+        return None
+
+    resp = await http.post("/login/refresh", data={"refresh_token": refresh_token})
+    if resp.status_code == 200:
+        state.tokens[user.email] = resp.json()["access_token"]
+        state.refresh_tokens[user.email] = resp.json()["refresh_token"]
+    return resp
+
+
+async def do_get(http, state: LoadState) -> Optional[httpx.Response]:
+    user = random.choice(state.clients)
+    target = random.choice(state.clients)
+    return await http.get(
+        "/user/", params={"user_id": str(target.user_id)}, headers=state.headers(user)
+    )
+
+
+async def do_patch(http, state: LoadState) -> Optional[httpx.Response]:
+    user = random.choice(state.clients)
+    return await http.patch(
+        "/user/",
+        params={"user_id": str(user.user_id)},
+        json={"name": random_name()},
+        headers=state.headers(user),
+    )
+
+
+async def do_delete(http, state: LoadState) -> Optional[httpx.Response]:
+    if not state.delete_targets:
+        return None
+    target = state.delete_targets.pop()
+    return await http.delete(
+        "/user/",
+        params={"user_id": str(target.user_id)},
+        headers=state.headers(state.superadmin),
+    )
+
+
+async def do_grant_admin(http, state: LoadState) -> Optional[httpx.Response]:
+    if not state.not_admins:
+        return None
+    target = state.not_admins.pop(random.randrange(len(state.not_admins)))
+    resp = await http.patch(
+        "/user/admin_privilege",
+        params={"user_id": str(target.user_id)},
+        headers=state.headers(state.superadmin),
+    )
+    (state.admins if resp.status_code == 200 else state.not_admins).append(target)
+    return resp
+
+
+async def do_revoke_admin(http, state: LoadState) -> Optional[httpx.Response]:
+    if not state.admins:
+        return None
+    target = state.admins.pop(random.randrange(len(state.admins)))
+    resp = await http.delete(
+        "/user/admin_privilege",
+        params={"user_id": str(target.user_id)},
+        headers=state.headers(state.superadmin),
+    )
+    (state.not_admins if resp.status_code == 200 else state.admins).append(target)
+    return resp
+
+
+ACTIONS = {
+    "login": do_login,
+    "refresh": do_refresh,
+    "get": do_get,
+    "patch": do_patch,
+    "delete": do_delete,
+    "grant_admin": do_grant_admin,
+    "revoke_admin": do_revoke_admin,
+}
+
+
+async def worker(http, state: LoadState, mix: dict, deadline: float) -> None:
+    routes = list(mix)
+    weights = [mix[route] for route in routes]
+
+    while monotonic() < deadline:
+        route = random.choices(routes, weights)[0]
+        start = perf_counter()
+        try:
+            resp = await ACTIONS[route](http, state)
+        except httpx.HTTPError:
+            state.errors[route] += 1
+            state.latencies[route].append(perf_counter() - start)
+            continue
+
+        if resp is None:
+            # для маршрута не осталось подходящих пользователей
+            continue
+
+        state.latencies[route].append(perf_counter() - start)
+        state.statuses[route][resp.status_code] += 1
+        if resp.status_code >= 400:
+            state.errors[route] += 1
+
+
+def summarize(state: LoadState, elapsed: float) -> dict:
+    routes = {}
+    for route, latencies in sorted(state.latencies.items()):
+        latencies.sort()
+        routes[route] = {
+            "requests": len(latencies),
+            "rps": len(latencies) / elapsed,
+            "error_rate": state.errors[route] / len(latencies),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "statuses": {str(k): v for k, v in sorted(state.statuses[route].items())},
+        }
+    total = sum(route["requests"] for route in routes.values())
+    return {"requests": total, "rps": total / elapsed, "routes": routes}
+
+
+def print_summary(summary: dict) -> None:
+    print(
+        f"{'route':<14}{'requests':>10}{'rps':>10}{'errors':>9}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for route, result in summary["routes"].items():
+        print(
+            f"{route:<14}{result['requests']:>10}{result['rps']:>10.1f}"
+            f"{result['error_rate']:>9.1%}{result['p50_ms']:>10.1f}"
+            f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+        )
+    print(f"{'total':<14}{summary['requests']:>10}{summary['rps']:>10.1f}")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    clients = [
+        SeedUser(f"client{number}@{EMAIL_DOMAIN}") for number in range(args.users)
+    ]
+    superadmin = SeedUser(
+        f"superadmin@{EMAIL_DOMAIN}",
+        roles=[PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_SUPERADMIN],
+    )
+    targets = {
+        "delete": [
+            SeedUser(f"delete{number}@{EMAIL_DOMAIN}") for number in range(args.targets)
+        ],
+        "roles": [
+            SeedUser(f"role{number}@{EMAIL_DOMAIN}") for number in range(args.targets)
+        ],
+    }
+
+    connection = await connect(args.db_url)
+    await remove_users(connection, EMAIL_DOMAIN)
+    # один хеш на всех: хеширование при засеве не измеряется
+    await seed_users(
+        connection,
+        [*clients, superadmin, *targets["delete"], *targets["roles"]],
+        hashed_password=Hasher.get_password_hash(PASSWORD),
+    )
+
+    state = LoadState(clients, superadmin, targets)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(
+            base_url=args.base_url, limits=limits, timeout=args.timeout
+        ) as http:
+            # токены получаются заранее и в измерения не входят
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def prepare(user):
+                async with semaphore:
+                    for _ in range(5):
+                        resp = await login(http, state, user)
+                        # 503 - сработало ограничение одновременных логинов
+                        if resp.status_code != 503:
+                            break
+                        await asyncio.sleep(float(resp.headers.get("Retry-After", 1)))
+
+            await asyncio.gather(*(prepare(user) for user in [*clients, superadmin]))
+
+            mix = MIXES[args.mix]
+            start = monotonic()
+            deadline = start + args.duration
+            await asyncio.gather(
+                *(worker(http, state, mix, deadline) for _ in range(args.concurrency))
+            )
+            elapsed = monotonic() - start
+    finally:
+        if not args.keep:
+            await remove_users(connection, EMAIL_DOMAIN)
+        await connection.close()
+
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "config": {
+            "base_url": args.base_url,
+            "mix": args.mix,
+            "weights": MIXES[args.mix],
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "users": args.users,
+        },
+        "elapsed": elapsed,
+        **summarize(state, elapsed),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the service")
+    parser.add_argument("--base-url", default=f"http://127.0.0.1:{settings.APP_PORT}")
+    parser.add_argument(
+        "--db-url",
+        default=settings.REAL_DATABASE_URL,
+        help="database of the tested instance, for seeding",
+    )
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument(
+        "--targets", type=int, default=200, help="users for delete and role changes"
+    )
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument(
+        "--keep", action="store_true", help="do not remove seeded users"
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_summary(results)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Microbenchmarks of hot in-process functions.
+
+Run with: pytest bench/micro (make bench_micro)
+
+Each benchmark measures the best time of one call over several repeats,
+together with the time of a fixed reference workload measured right before
+it. The ratio of the two is compared with bench/micro/baseline.json, so the
+committed baseline holds on machines of different speed and under
+varying load. A benchmark fails when its ratio is higher than the baseline
+by more than the threshold (--bench-threshold or BENCH_THRESHOLD, 0.25
+means 25%). Benchmarks missing from the baseline are recorded on the first
+run; after an intended change of speed --bench-update-baseline records all
+of them, and the new baseline.json is committed with the change.
+"""
+import json
+import os
+from pathlib import Path
+from timeit import Timer
+
+import pytest
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+# Минимальное время одного повтора, по нему подбирается число вызовов
+MIN_REPEAT_SECONDS = 0.05
+REPEATS = 5
+# Сколько раз замер повторяется, прежде чем бенчмарк считается упавшим
+MEASURE_ATTEMPTS = 3
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("microbenchmarks")
+    group.addoption(
+        "--bench-threshold",
+        type=float,
+        default=float(os.environ.get("BENCH_THRESHOLD", 0.25)),
+        help="allowed slowdown against the baseline, 0.25 means 25%%",
+    )
+    group.addoption(
+        "--bench-update-baseline",
+        action="store_true",
+        help="record results of all benchmarks as the new baseline",
+    )
+
+
+@pytest.fixture(scope="session")
+def baseline(request):
+    data = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    results = {}
+    yield data, results
+
+    update = request.config.getoption("--bench-update-baseline")
+    missing = {name: value for name, value in results.items() if name not in data}
+
+    if update or missing:
+        data.update(results if update else missing)
+        BASELINE_PATH.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+
+def reference_workload() -> list:
+    """Pure Python work the benchmarks are measured against"""
+    return sorted(str(number) for number in range(200))
+
+
+def measure(func, *args, **kwargs) -> float:
+    """Best time of one call in seconds"""
+    timer = Timer(lambda: func(*args, **kwargs))
+    number, _ = timer.autorange()
+    # autorange набирает 0.2 секунды; для медленных функций хватает меньшего
+    number = max(1, int(number * MIN_REPEAT_SECONDS / 0.2))
+    return min(timer.repeat(repeat=REPEATS, number=number)) / number
+
+
+@pytest.fixture
+def benchmark(request, baseline):
+    """Measure the function and compare it with the baseline"""
+    data, results = baseline
+    threshold = request.config.getoption("--bench-threshold")
+    name = request.node.name
+
+    def run(func, *args, **kwargs):
+        expected = data.get(name)
+        for _ in range(MEASURE_ATTEMPTS):
+            # эталон измеряется рядом с функцией, чтобы на них действовала
+            # одна и та же нагрузка машины
+            reference = measure(reference_workload)
+            seconds = measure(func, *args, **kwargs)
+            ratio = seconds / reference
+            # повторный замер отсеивает случайный всплеск нагрузки
+            if expected is None or ratio <= expected * (1 + threshold):
+                break
+        results[name] = ratio
+
+        if expected is not None and ratio > expected * (1 + threshold):
+            pytest.fail(
+                f"{name}: {seconds * 1e6:.1f} us per call, {ratio:.3f} of the "
+                f"reference, baseline {expected:.3f} (threshold {threshold:.0%})"
+            )
+        return seconds
+
+    return run
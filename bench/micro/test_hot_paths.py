@@ -0,0 +1,71 @@
+from uuid import uuid4
+
+from jose import jwt
+
+import settings
+from api.actions.auth import _decode_token
+from api.actions.user import check_user_permissions
+from api.schemas import UpdateUserRequest
+from api.schemas import UserCreate
+from db.models import PortalRole
+from db.models import UserRow
+from hashing import Hasher
+from security import create_access_token
+from security import get_user_claims
+
+USER = UserRow(
+    user_id=uuid4(),
+    name="Bench",
+    surname="User",
+    email="bench@sdf.com",
+    role_mask=PortalRole.ROLE_PORTAL_USER.bit,
+)
+ADMIN = UserRow(
+    user_id=uuid4(),
+    name="Bench",
+    surname="Admin",
+    email="admin@sdf.com",
+    role_mask=PortalRole.ROLE_PORTAL_USER.bit | PortalRole.ROLE_PORTAL_ADMIN.bit,
+)
+TOKEN = create_access_token(data=get_user_claims(USER))
+
+
+def test_verify_password(benchmark):
+    hashed_password = Hasher.get_password_hash("SamplePass1!")
+    benchmark(Hasher.verify_password, "SamplePass1!", hashed_password)
+
+
+def test_create_access_token(benchmark):
+    benchmark(create_access_token, get_user_claims(USER))
+
+
+def test_jwt_decode(benchmark):
+    benchmark(jwt.decode, TOKEN, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+
+def test_decode_token_cached(benchmark):
+    _decode_token(TOKEN)
+    benchmark(_decode_token, TOKEN)
+
+
+def test_check_user_permissions(benchmark):
+    benchmark(check_user_permissions, USER, ADMIN)
+
+
+def test_user_create_validation(benchmark):
+    benchmark(
+        UserCreate.parse_obj,
+        {
+            "name": "Bench",
+            "surname": "User",
+            "email": "bench@sdf.com",
+            "password": "SamplePass1!",
+        },
+    )
+
+
+def test_update_user_request_validation(benchmark):
+    benchmark(
+        UpdateUserRequest.parse_obj,
+        {"name": "Bench", "surname": "User", "email": "bench@sdf.com"},
+    )
@@ -0,0 +1,67 @@
+"""Seeding of benchmark users with COPY.
+
+Benchmark users have emails in their own domain, so they can be removed
+without touching other data.
+"""
+import uuid
+from dataclasses import dataclass
+from dataclasses import field
+
+import asyncpg
+
+from db.models import PortalRole
+from db.models import roles_to_mask
+
+COLUMNS = [
+    "user_id",
+    "name",
+    "surname",
+    "email",
+    "is_active",
+    "hashed_password",
+    "role_mask",
+    "token_version",
+]
+
+
+@dataclass
+class SeedUser:
+    email: str
+    roles: list = field(default_factory=lambda: [PortalRole.ROLE_PORTAL_USER])
+    user_id: uuid.UUID = field(default_factory=uuid.uuid4)
+
+
+def asyncpg_dsn(url: str) -> str:
+    """SQLAlchemy URL of the database as asyncpg DSN"""
+    return url.replace("+asyncpg", "")
+
+
+async def connect(url: str) -> asyncpg.Connection:
+    return await asyncpg.connect(asyncpg_dsn(url))
+
+
+async def seed_users(
+    connection: asyncpg.Connection, users: list[SeedUser], hashed_password: str
+) -> None:
+    await connection.copy_records_to_table(
+        "users",
+        records=[
+            (
+                user.user_id,
+                "Bench",
+                "User",
+                user.email,
+                True,
+                hashed_password,
+                roles_to_mask(user.roles),
+                0,
+            )
+            for user in users
+        ],
+        columns=COLUMNS,
+    )
+
+
+async def remove_users(connection: asyncpg.Connection, domain: str) -> None:
+    # refresh-токены удаляются каскадно
+    await connection.execute("DELETE FROM users WHERE email LIKE $1", f"%@{domain}")
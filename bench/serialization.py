@@ -0,0 +1,109 @@
+"""Compare response serialization of /user routes.
+
+Renders a single user and a page of users the way FastAPI does for
+response_model (validation through ShowUser and the stdlib JSON encoder)
+and through api.responses (orjson straight from row data).
+
+Usage: python -m bench.serialization --page-size 500 --repeat 2000
+"""
+import argparse
+import asyncio
+import uuid
+from time import perf_counter
+from time import process_time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from api.handlers import user_router
+from api.responses import user_response
+from api.responses import users_page_response
+from db.models import PortalRole
+from db.models import UserRow
+
+
+def make_users(count: int) -> list[UserRow]:
+    return [
+        UserRow(
+            user_id=uuid.uuid4(),
+            name="Bench",
+            surname="User",
+            email=f"user{number}@example.com",
+            is_active=True,
+            hashed_password="-",
+            role_mask=PortalRole.ROLE_PORTAL_USER.bit,
+        )
+        for number in range(count)
+    ]
+
+
+def get_response_field(path: str, method: str):
+    for route in user_router.routes:
+        if route.path == path and method in route.methods:
+            return route.secure_cloned_response_field
+    raise LookupError(f"{method} {path} route not found")
+
+
+async def response_model_single(field, users):
+    content = await serialize_response(field=field, response_content=users[0])
+    return JSONResponse(content).body
+
+
+async def response_model_page(field, users):
+    content = await serialize_response(
+        field=field, response_content={"users": users, "next_cursor": None}
+    )
+    return JSONResponse(content).body
+
+
+async def fast_single(field, users):
+    return user_response(users[0]).body
+
+
+async def fast_page(field, users):
+    return users_page_response(users, None).body
+
+
+async def measure(render, field, users, repeat: int) -> tuple[float, float]:
+    for _ in range(min(repeat, 100)):
+        await render(field, users)
+
+    cpu_start = process_time()
+    start = perf_counter()
+    for _ in range(repeat):
+        await render(field, users)
+    return (
+        (perf_counter() - start) / repeat * 1e6,
+        (process_time() - cpu_start) / repeat * 1e6,
+    )
+
+
+async def run(page_size: int, repeat: int) -> None:
+    users = make_users(page_size)
+    single_field = get_response_field("/", "GET")
+    page_field = get_response_field("/list", "GET")
+
+    cases = [
+        ("single", "response_model", response_model_single, single_field),
+        ("single", "fast", fast_single, single_field),
+        (f"page of {page_size}", "response_model", response_model_page, page_field),
+        (f"page of {page_size}", "fast", fast_page, page_field),
+    ]
+
+    print(f"{'payload':<16}{'path':<16}{'wall us':>12}{'cpu us':>12}")
+    for payload, path, render, field in cases:
+        wall, cpu = await measure(render, field, users, repeat)
+        print(f"{payload:<16}{path:<16}{wall:>12.1f}{cpu:>12.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark user serialization")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.page_size, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any
+from typing import Callable
+from typing import Hashable
+from typing import Optional
+
+from metrics import CACHE_EVICTIONS
+from metrics import CACHE_HITS
+from metrics import CACHE_MISSES
+
+
+class TTLCache:
+    """Bounded in-process LRU cache with expiration of entries.
+
+    The cache is local to the worker process: other workers learn about
+    changes only after the entry expires.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        # key -> (время истечения, значение); порядок ключей - порядок LRU
+        self._data: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+
+        if item is None:
+            CACHE_MISSES.labels(self.name).inc()
+            return default
+
+        expires_at, value = item
+        if expires_at <= monotonic():
+            self._evict(key, "expired")
+            CACHE_MISSES.labels(self.name).inc()
+            return default
+
+        self._data.move_to_end(key)
+        CACHE_HITS.labels(self.name).inc()
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+
+        if ttl is None:
+            ttl = self.ttl
+
+        self._data[key] = (monotonic() + ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            oldest_key = next(iter(self._data))
+            self._evict(oldest_key, "size")
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+
+        if item is None:
+            return default
+
+        CACHE_EVICTIONS.labels(self.name, "invalidated").inc()
+        if self.on_evict is not None:
+            self.on_evict(key, item[1])
+        return item[1]
+
+    def clear(self) -> None:
+        for key in list(self._data):
+            self.pop(key)
+
+    def _evict(self, key: Hashable, reason: str) -> None:
+        _, value = self._data.pop(key)
+        CACHE_EVICTIONS.labels(self.name, reason).inc()
+
+        if self.on_evict is not None:
+            self.on_evict(key, value)
@@ -0,0 +1,93 @@
+"""Measure password hashing time and suggest cost for a target latency.
+
+Usage: python calibrate_hashing.py --scheme bcrypt --target-ms 250
+"""
+import argparse
+from time import perf_counter
+
+from hashing import create_pwd_context
+
+PASSWORD = "calibration-password"
+
+
+def measure_ms(context, samples: int) -> float:
+    """Median time of one hash in milliseconds"""
+    # первый вызов загружает backend и не учитывается
+    context.hash(PASSWORD)
+    times = []
+    for _ in range(samples):
+        start = perf_counter()
+        context.hash(PASSWORD)
+        times.append((perf_counter() - start) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def calibrate_bcrypt(target_ms: float, samples: int) -> dict:
+    suggested = 4
+    for rounds in range(4, 32):
+        elapsed = measure_ms(
+            create_pwd_context(scheme="bcrypt", bcrypt_rounds=rounds), samples
+        )
+        print(f"bcrypt rounds={rounds}: {elapsed:.1f} ms")
+        if elapsed > target_ms:
+            break
+        suggested = rounds
+
+    return {"PASSWORD_HASH_SCHEME": "bcrypt", "BCRYPT_ROUNDS": suggested}
+
+
+def calibrate_argon2(
+    target_ms: float, samples: int, memory_cost: int, parallelism: int
+) -> dict:
+    # память задаётся явно, подбирается число проходов
+    suggested = 1
+    for time_cost in range(1, 64):
+        elapsed = measure_ms(
+            create_pwd_context(
+                scheme="argon2",
+                argon2_memory_cost=memory_cost,
+                argon2_time_cost=time_cost,
+                argon2_parallelism=parallelism,
+            ),
+            samples,
+        )
+        print(f"argon2 time_cost={time_cost}: {elapsed:.1f} ms")
+        if elapsed > target_ms:
+            break
+        suggested = time_cost
+
+    return {
+        "PASSWORD_HASH_SCHEME": "argon2",
+        "ARGON2_MEMORY_COST": memory_cost,
+        "ARGON2_TIME_COST": suggested,
+        "ARGON2_PARALLELISM": parallelism,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Calibrate password hashing")
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2"], default="bcrypt")
+    parser.add_argument(
+        "--target-ms", type=float, default=250.0, help="max time of one hash"
+    )
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument(
+        "--memory-kib", type=int, default=65536, help="argon2 memory cost"
+    )
+    parser.add_argument("--parallelism", type=int, default=4, help="argon2 lanes")
+    args = parser.parse_args()
+
+    if args.scheme == "bcrypt":
+        suggested = calibrate_bcrypt(args.target_ms, args.samples)
+    else:
+        suggested = calibrate_argon2(
+            args.target_ms, args.samples, args.memory_kib, args.parallelism
+        )
+
+    print("\nSuggested settings:")
+    for name, value in suggested.items():
+        print(f"{name}={value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,81 +1,431 @@
+from datetime import datetime
+from datetime import timedelta
+from time import perf_counter
+from typing import AsyncIterator
+from typing import Optional
 from typing import Union
 from uuid import UUID
 
 from sqlalchemy import and_
+from sqlalchemy import any_
+from sqlalchemy import bindparam
+from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import literal
+from sqlalchemy import literal_column
+from sqlalchemy import not_
+from sqlalchemy import or_
 from sqlalchemy import select
+from sqlalchemy import true
 from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import ColumnElement
+from sqlalchemy.sql import Update
+from sqlalchemy.sql.expression import BindParameter
 
+import settings
+from db.instrumentation import current_method
+from db.instrumentation import dal_method
+from db.instrumentation import observe_error
+from db.instrumentation import observe_statement
+from db.models import ADMIN_ROLES_MASK
+from db.models import AUTH_COLUMNS
 from db.models import PortalRole
+from db.models import RefreshToken
 from db.models import User
+from db.models import UserRow
 
 ###########################################################
 # BLOCK FOR INTERACTION WITH DATABASE IN BUSINESS CONTEXT #
 ###########################################################
 
+# Поля, при изменении которых увеличивается User.token_version
+TOKEN_REVOKING_FIELDS = {"email", "role_mask", "is_active"}
+
+
+def has_roles(mask: int) -> ColumnElement:
+    """User has any of the roles in mask.
+
+    Constants are rendered as literals, so the condition matches the partial
+    indexes of User when a prepared statement uses a generic plan.
+    """
+    return User.role_mask.op("&")(literal_column(str(int(mask)))) != literal_column("0")
+
+
+def ids_array(user_ids: list[UUID]) -> BindParameter:
+    """List of ids as one uuid[] parameter for = ANY(...)"""
+    return bindparam("user_ids", list(user_ids), type_=ARRAY(PG_UUID(as_uuid=True)))
+
+
+def user_permission_clause(current_user) -> ColumnElement:
+    """Condition on the users row which current_user is allowed to manage.
+
+    SQL version of api.actions.user.check_user_permissions.
+    """
+    is_himself = User.user_id == current_user.user_id
+
+    if not current_user.role_mask & ADMIN_ROLES_MASK:
+        return is_himself
+
+    # админ не может управлять админами и суперадминами
+    if current_user.is_admin:
+        return or_(is_himself, not_(has_roles(ADMIN_ROLES_MASK)))
+
+    return true()
+
 
 class UserDAL:
-    """Data Access Layer for operating user info"""
+    """Data Access Layer for operating user info.
+
+    Reads marked with replica_ok may be executed on a read replica
+    (see db.session.RoutingSession).
+    """
 
     def __init__(self, db_session: AsyncSession):
         self.db_session = db_session
 
+    @dal_method
     async def create_user(
         self,
         name: str,
         surname: str,
         email: str,
         hashed_password: str,
-        roles: list[PortalRole],
+        role_mask: int,
     ) -> User:
         new_user = User(
             name=name,
             surname=surname,
             email=email,
             hashed_password=hashed_password,
-            roles=roles,
+            role_mask=role_mask,
         )
         self.db_session.add(new_user)
         await self.db_session.flush()
 
         return new_user
 
-    async def delete_user(self, user_id: UUID) -> Union[UUID, None]:
-        # Запрос для обновления
+    @dal_method
+    async def create_users_bulk(self, users: list[dict]) -> dict[str, UUID]:
+        """Insert users with one multi-row statement.
+
+        Rows with already registered emails are skipped.
+        Returns user_id of inserted users by email.
+        """
         query = (
-            update(User)
-            .where(and_(User.user_id == user_id, User.is_active == True))
-            .values(is_active=False)
-            .returning(User.user_id)
+            insert(User)
+            .values(users)
+            .on_conflict_do_nothing(index_elements=[User.email])
+            .returning(User.email, User.user_id)
         )
 
         res = await self.db_session.execute(query)
-        deleted_user_id_row = res.fetchone()
+        return {email: user_id for email, user_id in res.fetchall()}
+
+    async def _execute_authorized(self, user_id: UUID, query: Update) -> Optional[Row]:
+        """Run the guarded write and read the target row in one statement.
+
+        Returns None if the user does not exist. Otherwise the row has
+        user_id, role_mask, is_active and version of the user as they were
+        before the write, and written_user_id with written_version, which
+        are None if the write conditions (permissions, activity, version)
+        excluded the user.
+        """
+        target = (
+            select(User.user_id, User.role_mask, User.is_active, User.version)
+            .where(User.user_id == user_id)
+            .cte("target")
+        )
+        written = query.returning(User.user_id, User.version).cte("written")
+
+        # оба CTE видят один снимок данных, поэтому target содержит
+        # состояние пользователя до изменения
+        res = await self.db_session.execute(
+            select(
+                target.c.user_id,
+                target.c.role_mask,
+                target.c.is_active,
+                target.c.version,
+                written.c.user_id.label("written_user_id"),
+                written.c.version.label("written_version"),
+            ).select_from(target.outerjoin(written, true()))
+        )
+        return res.fetchone()
+
+    async def _execute_authorized_many(
+        self, user_ids: list[UUID], query: Update
+    ) -> list[Row]:
+        """Set-wise version of _execute_authorized.
+
+        The ids are passed as one array parameter, so the statement is the
+        same for any number of users. Returns a row for every existing user;
+        missing users have no row.
+        """
+        ids = ids_array(user_ids)
+        target = (
+            select(User.user_id, User.role_mask, User.is_active)
+            .where(User.user_id == any_(ids))
+            .cte("target")
+        )
+        written = query.where(User.user_id == any_(ids)).returning(User.user_id)
+        written = written.cte("written")
+
+        res = await self.db_session.execute(
+            select(
+                target.c.user_id,
+                target.c.role_mask,
+                target.c.is_active,
+                written.c.user_id.label("written_user_id"),
+            ).select_from(
+                target.outerjoin(written, target.c.user_id == written.c.user_id)
+            )
+        )
+        return res.fetchall()
+
+    @dal_method
+    async def grant_admin_bulk(
+        self, user_ids: list[UUID], current_user_id: UUID
+    ) -> list[Row]:
+        """Add admin role to active users which are not admins or superadmins"""
+        query = (
+            update(User)
+            .where(
+                and_(
+                    User.user_id != current_user_id,
+                    User.is_active == True,
+                    not_(has_roles(ADMIN_ROLES_MASK)),
+                )
+            )
+            .values(
+                role_mask=User.role_mask.op("|")(PortalRole.ROLE_PORTAL_ADMIN.bit),
+                token_version=User.token_version + 1,
+                version=User.version + 1,
+            )
+        )
+        return await self._execute_authorized_many(user_ids, query)
+
+    @dal_method
+    async def revoke_admin_bulk(
+        self, user_ids: list[UUID], current_user_id: UUID
+    ) -> list[Row]:
+        """Remove admin role from active admins"""
+        query = (
+            update(User)
+            .where(
+                and_(
+                    User.user_id != current_user_id,
+                    User.is_active == True,
+                    has_roles(PortalRole.ROLE_PORTAL_ADMIN.bit),
+                )
+            )
+            .values(
+                role_mask=User.role_mask.op("&")(~PortalRole.ROLE_PORTAL_ADMIN.bit),
+                token_version=User.token_version + 1,
+                version=User.version + 1,
+            )
+        )
+        return await self._execute_authorized_many(user_ids, query)
+
+    @dal_method
+    async def update_user_authorized(
+        self,
+        user_id: UUID,
+        current_user,
+        expected_versions: Optional[list[int]] = None,
+        **kwargs,
+    ) -> Optional[Row]:
+        """Update active user if current_user has permissions for it.
 
-        if deleted_user_id_row is not None:
-            return deleted_user_id_row[0]
+        With expected_versions the user is updated only if its version is
+        one of them (If-Match), without locking the row.
+        """
+        conditions = [
+            User.user_id == user_id,
+            User.is_active == True,
+            user_permission_clause(current_user),
+        ]
+        if expected_versions is not None:
+            conditions.append(User.version.in_(expected_versions))
 
+        query = (
+            update(User)
+            .where(and_(*conditions))
+            .values(self._get_update_values(kwargs))
+        )
+        return await self._execute_authorized(user_id, query)
+
+    @dal_method
+    async def delete_user_authorized(
+        self, user_id: UUID, current_user
+    ) -> Optional[Row]:
+        """Deactivate user if current_user has permissions for it.
+
+        Superadmin can not be deactivated.
+        """
+        query = (
+            update(User)
+            .where(
+                and_(
+                    User.user_id == user_id,
+                    User.is_active == True,
+                    user_permission_clause(current_user),
+                    not_(has_roles(PortalRole.ROLE_PORTAL_SUPERADMIN.bit)),
+                )
+            )
+            .values(
+                is_active=False,
+                token_version=User.token_version + 1,
+                version=User.version + 1,
+            )
+        )
+        return await self._execute_authorized(user_id, query)
+
+    @dal_method
+    async def delete_users_authorized(
+        self, user_ids: list[UUID], current_user
+    ) -> list[Row]:
+        """Set-wise version of delete_user_authorized"""
+        query = (
+            update(User)
+            .where(
+                and_(
+                    User.is_active == True,
+                    user_permission_clause(current_user),
+                    not_(has_roles(PortalRole.ROLE_PORTAL_SUPERADMIN.bit)),
+                )
+            )
+            .values(
+                is_active=False,
+                token_version=User.token_version + 1,
+                version=User.version + 1,
+            )
+        )
+        return await self._execute_authorized_many(user_ids, query)
+
+    @dal_method
     async def get_user_by_id(self, user_id: UUID) -> Union[User, None]:
-        query = select(User).where(User.user_id == user_id)
+        query = (
+            select(User)
+            .where(User.user_id == user_id)
+            .execution_options(replica_ok=True)
+        )
         res = await self.db_session.execute(query)
         user_row = res.fetchone()
 
         if user_row is not None:
             return user_row[0]
 
-    async def get_user_by_email(self, email: str) -> Union[User, None]:
-        query = select(User).where(User.email == email)
+    @dal_method
+    async def list_users(
+        self,
+        limit: int,
+        after: Optional[UUID] = None,
+        is_active: Optional[bool] = None,
+        role: Optional[PortalRole] = None,
+    ) -> list[User]:
+        """Page of users ordered by user_id, starting after the given id.
+
+        Keyset pagination: the page is found by the index on user_id,
+        so the cost does not depend on the page number.
+        """
+        query = (
+            select(User)
+            .order_by(User.user_id)
+            .limit(limit)
+            .execution_options(replica_ok=True)
+        )
+
+        if after is not None:
+            query = query.where(User.user_id > after)
+
+        if is_active is not None:
+            query = query.where(User.is_active == is_active)
+
+        if role is not None:
+            query = query.where(has_roles(role.bit))
+
         res = await self.db_session.execute(query)
-        user_row = res.fetchone()
+        return list(res.scalars())
 
-        if user_row is not None:
-            return user_row[0]
+    @dal_method
+    async def stream_users(self, batch_size: int) -> AsyncIterator[list[Row]]:
+        """Read all users with a server-side cursor, batch by batch.
+
+        Next batch is fetched only when the previous one is consumed,
+        so memory usage does not depend on the table size.
+        """
+        query = (
+            select(
+                User.user_id,
+                User.name,
+                User.surname,
+                User.email,
+                User.is_active,
+                User.role_mask,
+            )
+            .order_by(User.user_id)
+            .execution_options(replica_ok=True)
+        )
+
+        result = await self.db_session.stream(
+            query, execution_options={"max_row_buffer": batch_size}
+        )
+        async for rows in result.partitions(batch_size):
+            yield rows
 
+    @dal_method
+    async def get_auth_user_by_email(self, email: str) -> Optional[UserRow]:
+        """User for authentication, read from the covering email index"""
+        query = (
+            select(User.email, *(getattr(User, column) for column in AUTH_COLUMNS))
+            .where(User.email == email.lower())
+            .execution_options(replica_ok=True)
+        )
+        res = await self.db_session.execute(query)
+        row = res.fetchone()
+
+        if row is not None:
+            return UserRow(**row._mapping)
+
+    @dal_method
+    async def get_token_version(self, user_id: UUID) -> Union[int, None]:
+        query = (
+            select(User.token_version)
+            .where(User.user_id == user_id)
+            .execution_options(replica_ok=True)
+        )
+        res = await self.db_session.execute(query)
+        return res.scalar_one_or_none()
+
+    @dal_method
+    async def get_user_version(self, user_id: UUID) -> Union[int, None]:
+        """Version of the user row, for conditional requests"""
+        query = (
+            select(User.version)
+            .where(User.user_id == user_id)
+            .execution_options(replica_ok=True)
+        )
+        res = await self.db_session.execute(query)
+        return res.scalar_one_or_none()
+
+    @staticmethod
+    def _get_update_values(kwargs: dict) -> dict:
+        kwargs = {**kwargs, "version": User.version + 1}
+        # смена email или ролей отзывает ранее выданные токены
+        if TOKEN_REVOKING_FIELDS.intersection(kwargs):
+            kwargs["token_version"] = User.token_version + 1
+        return kwargs
+
+    @dal_method
     async def update_user(self, user_id: UUID, **kwargs) -> Union[UUID, None]:
         query = (
             update(User)
             .where(and_(User.user_id == user_id, User.is_active == True))
-            .values(kwargs)
+            .values(self._get_update_values(kwargs))
             .returning(User.user_id)
         )
 
@@ -84,3 +434,225 @@ class UserDAL:
 
         if update_user_id_row is not None:
             return update_user_id_row[0]
+
+    @dal_method
+    async def update_password_hash(
+        self, user_id: UUID, old_hash: str, new_hash: str
+    ) -> bool:
+        """Replace hash of the password if it was not changed meanwhile"""
+        query = (
+            update(User)
+            .where(and_(User.user_id == user_id, User.hashed_password == old_hash))
+            # version не меняется: хеш не входит в ответы API и ETag
+            .values(hashed_password=new_hash)
+            .returning(User.user_id)
+        )
+
+        res = await self.db_session.execute(query)
+        return res.fetchone() is not None
+
+
+class RefreshTokenDAL:
+    """Data Access Layer for operating refresh tokens"""
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    @dal_method
+    async def create_refresh_token(
+        self, user_id: UUID, token_hash: str, token_version: int, expires_at: datetime
+    ) -> None:
+        """Insert the token and prune tokens of the user which are not needed.
+
+        Expired tokens are deleted. Revoked tokens are kept for
+        REFRESH_TOKEN_REVOKED_KEEP_HOURS to detect their reuse.
+        """
+        revoked_before = func.now() - timedelta(
+            hours=settings.REFRESH_TOKEN_REVOKED_KEEP_HOURS
+        )
+        pruned = (
+            delete(RefreshToken)
+            .where(
+                and_(
+                    RefreshToken.user_id == user_id,
+                    or_(
+                        RefreshToken.expires_at <= func.now(),
+                        RefreshToken.revoked_at < revoked_before,
+                    ),
+                )
+            )
+            .returning(RefreshToken.token_id)
+            .cte("pruned")
+        )
+        # удаление выполняется тем же запросом, что и вставка
+        query = (
+            insert(RefreshToken)
+            .values(
+                user_id=user_id,
+                token_hash=token_hash,
+                token_version=token_version,
+                expires_at=expires_at,
+            )
+            .add_cte(pruned)
+        )
+        await self.db_session.execute(query)
+
+    @dal_method
+    async def revoke_refresh_token(self, token_hash: str) -> Optional[UserRow]:
+        """Revoke a valid token and return its active user in one statement.
+
+        Returns None if the token is unknown, expired, already revoked or
+        issued before token_version of the user was increased.
+        """
+        query = (
+            update(RefreshToken)
+            .where(
+                and_(
+                    RefreshToken.token_hash == token_hash,
+                    RefreshToken.revoked_at.is_(None),
+                    RefreshToken.expires_at > func.now(),
+                    RefreshToken.user_id == User.user_id,
+                    RefreshToken.token_version == User.token_version,
+                    User.is_active == True,
+                )
+            )
+            .values(revoked_at=func.now())
+            # now() не вычисляется в Python, а объекты токенов в сессию
+            # не загружаются
+            .execution_options(synchronize_session=False)
+            .returning(
+                User.user_id,
+                User.name,
+                User.surname,
+                User.email,
+                User.is_active,
+                User.role_mask,
+                User.token_version,
+            )
+        )
+
+        res = await self.db_session.execute(query)
+        row = res.fetchone()
+
+        if row is not None:
+            return UserRow(**row._mapping)
+
+    @dal_method
+    async def revoke_all_if_reused(self, token_hash: str) -> None:
+        """Revoke all tokens of the user if the token was already revoked.
+
+        A rotated token which is presented again was probably stolen, so
+        the tokens issued instead of it are not trusted either.
+        """
+        owner = (
+            select(RefreshToken.user_id)
+            .where(
+                and_(
+                    RefreshToken.token_hash == token_hash,
+                    RefreshToken.revoked_at.is_not(None),
+                )
+            )
+            .scalar_subquery()
+        )
+        query = (
+            update(RefreshToken)
+            .where(
+                and_(RefreshToken.user_id == owner, RefreshToken.revoked_at.is_(None))
+            )
+            .values(revoked_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        await self.db_session.execute(query)
+
+
+# Запрос-метка: соединение для него выбирается так же, как для чтений
+# UserDAL (реплика, если она назначена запросу)
+_REPLICA_READ = select(literal(1)).execution_options(replica_ok=True)
+
+
+class AsyncpgUserDAL(UserDAL):
+    """UserDAL with hot reads executed directly through asyncpg.
+
+    Statements are sent through the connection checked out by the session
+    and inside its transaction, so the pool, replica routing and the request
+    transaction are shared with UserDAL. They are prepared once per
+    connection by the asyncpg statement cache. Rows are
+    returned as UserRow without ORM compilation and identity map. Writes
+    are inherited from UserDAL.
+    """
+
+    USER_COLUMNS = (
+        "user_id, name, surname, email, is_active, hashed_password, role_mask, "
+        "token_version, version"
+    )
+    GET_USER_BY_ID = f"SELECT {USER_COLUMNS} FROM users WHERE user_id = $1"
+    GET_AUTH_USER_BY_EMAIL = (
+        f"SELECT email, {', '.join(AUTH_COLUMNS)} FROM users WHERE email = $1"
+    )
+    GET_TOKEN_VERSION = "SELECT token_version FROM users WHERE user_id = $1"
+    GET_USER_VERSION = "SELECT version FROM users WHERE user_id = $1"
+
+    async def _get_driver_connection(self):
+        connection = await self.db_session.connection(
+            bind_arguments={"clause": _REPLICA_READ}
+        )
+        raw_connection = await connection.get_raw_connection()
+
+        # адаптер SQLAlchemy начинает транзакцию лениво, перед своим первым
+        # запросом; без этого запрос мимо него выполнился бы вне транзакции
+        # запроса
+        adapted_connection = raw_connection.dbapi_connection
+        if not adapted_connection._started:
+            await adapted_connection._start_transaction()
+
+        return raw_connection.driver_connection
+
+    async def _fetchrow(self, query: str, *args):
+        driver_connection = await self._get_driver_connection()
+
+        # запросы идут мимо SQLAlchemy, поэтому события engine их не видят
+        start = perf_counter()
+        try:
+            record = await driver_connection.fetchrow(query, *args)
+        except Exception:
+            observe_error(current_method())
+            raise
+
+        observe_statement(current_method(), perf_counter() - start)
+        return record
+
+    @dal_method
+    async def get_user_by_id(self, user_id: UUID) -> Union[UserRow, None]:
+        record = await self._fetchrow(self.GET_USER_BY_ID, user_id)
+
+        if record is not None:
+            return UserRow(**record)
+
+    @dal_method
+    async def get_auth_user_by_email(self, email: str) -> Optional[UserRow]:
+        record = await self._fetchrow(self.GET_AUTH_USER_BY_EMAIL, email.lower())
+
+        if record is not None:
+            return UserRow(**record)
+
+    @dal_method
+    async def get_token_version(self, user_id: UUID) -> Union[int, None]:
+        record = await self._fetchrow(self.GET_TOKEN_VERSION, user_id)
+
+        if record is not None:
+            return record["token_version"]
+
+    @dal_method
+    async def get_user_version(self, user_id: UUID) -> Union[int, None]:
+        record = await self._fetchrow(self.GET_USER_VERSION, user_id)
+
+        if record is not None:
+            return record["version"]
+
+
+def get_user_dal(db_session: AsyncSession) -> UserDAL:
+    """UserDAL implementation selected by USER_DAL_BACKEND setting"""
+    if settings.USER_DAL_BACKEND == "asyncpg":
+        return AsyncpgUserDAL(db_session)
+
+    return UserDAL(db_session)
@@ -0,0 +1,119 @@
+"""Timing of database statements by the DAL method which issued them.
+
+DAL methods are wrapped with dal_method, which stores the method name in a
+context variable. Engine event hooks read it for every statement, so the
+histograms split database time by method. Statements outside DAL methods
+are labelled "other".
+
+Rows are counted by dal_method from what the method returns: the cursor
+rowcount is not known for SELECT under asyncpg, and the guarded writes are
+SELECT statements with CTE as well.
+"""
+import functools
+import inspect
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import DB_STATEMENT_DURATION
+from metrics import DB_STATEMENT_ERRORS
+from metrics import DB_STATEMENT_ROWS
+
+OTHER = "other"
+
+_current_method: ContextVar[Optional[str]] = ContextVar("dal_method", default=None)
+
+
+def current_method() -> str:
+    return _current_method.get() or OTHER
+
+
+def dal_method(func):
+    """Label statements executed by the method with its qualified name"""
+    name = func.__qualname__
+
+    if inspect.isasyncgenfunction(func):
+
+        @functools.wraps(func)
+        async def generator_wrapper(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            try:
+                while True:
+                    # метка ставится на каждый шаг: между шагами генератора
+                    # выполняется код вызывающей стороны
+                    token = _current_method.set(name)
+                    try:
+                        item = await generator.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        _current_method.reset(token)
+                    observe_rows(name, returned_rows(item))
+                    yield item
+            finally:
+                await generator.aclose()
+
+        return generator_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _current_method.set(name)
+        try:
+            result = await func(*args, **kwargs)
+        finally:
+            _current_method.reset(token)
+        observe_rows(name, returned_rows(result))
+        return result
+
+    return wrapper
+
+
+def returned_rows(result) -> int:
+    """Number of rows in the result of a DAL method"""
+    if result is None or result is False:
+        return 0
+    # список строк или словарь по ключу; всё остальное - одна строка
+    if isinstance(result, (list, dict)):
+        return len(result)
+    return 1
+
+
+def observe_rows(method: str, rows: int) -> None:
+    if rows > 0:
+        DB_STATEMENT_ROWS.labels(method).inc(rows)
+
+
+def observe_statement(method: str, seconds: float) -> None:
+    DB_STATEMENT_DURATION.labels(method).observe(seconds)
+
+
+def observe_error(method: str) -> None:
+    DB_STATEMENT_ERRORS.labels(method).inc()
+
+
+START_TIMES = "statement_start_times"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault(START_TIMES, []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    start = conn.info[START_TIMES].pop()
+    observe_statement(current_method(), perf_counter() - start)
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get(START_TIMES):
+        connection.info[START_TIMES].pop()
+    observe_error(current_method())
+
+
+def instrument_engine(engine: Engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -1,10 +1,18 @@
 import uuid
 from enum import Enum
+from typing import Iterable
+from typing import Optional
 
 from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import ForeignKey
+from sqlalchemy import func
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import SmallInteger
 from sqlalchemy import String
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base
 
@@ -31,30 +39,188 @@ class PortalRole(str, Enum):
     ROLE_PORTAL_ADMIN = "ROLE_PORTAL_ADMIN"
     ROLE_PORTAL_SUPERADMIN = "ROLE_PORTAL_SUPERADMIN"
 
+    @property
+    def bit(self) -> int:
+        return ROLE_BITS[self]
 
-class User(Base):
-    __tablename__ = "users"
 
-    user_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String, nullable=False)
-    surname = Column(String, nullable=False)
-    email = Column(String, nullable=False, unique=True)
-    is_active = Column(Boolean(), default=True)
-    hashed_password = Column(String, nullable=False)
-    roles = Column(ARRAY(String), nullable=False)
+# Роли хранятся в users.role_mask: одна роль - один бит.
+# Значения битов не меняются, они записаны в базе и в выданных токенах.
+ROLE_BITS = {
+    PortalRole.ROLE_PORTAL_USER: 1,
+    PortalRole.ROLE_PORTAL_ADMIN: 2,
+    PortalRole.ROLE_PORTAL_SUPERADMIN: 4,
+}
+ADMIN_ROLES_MASK = (
+    PortalRole.ROLE_PORTAL_ADMIN.bit | PortalRole.ROLE_PORTAL_SUPERADMIN.bit
+)
+
+
+def roles_to_mask(roles: Iterable[str]) -> int:
+    mask = 0
+    for role in roles:
+        mask |= PortalRole(role).bit
+    return mask
+
+
+def roles_from_mask(mask: int) -> list[PortalRole]:
+    return [role for role, bit in ROLE_BITS.items() if mask & bit]
+
+
+class UserRolesMixin:
+    """Role checks shared by ORM users and their lightweight copies"""
+
+    __slots__ = ()
+
+    @property
+    def roles(self) -> list[PortalRole]:
+        return roles_from_mask(self.role_mask)
 
     @property
     def is_superadmin(self) -> bool:
-        return PortalRole.ROLE_PORTAL_SUPERADMIN in self.roles
+        return bool(self.role_mask & PortalRole.ROLE_PORTAL_SUPERADMIN.bit)
 
     @property
     def is_admin(self) -> bool:
-        return PortalRole.ROLE_PORTAL_ADMIN in self.roles
+        return bool(self.role_mask & PortalRole.ROLE_PORTAL_ADMIN.bit)
 
     def enrich_admin_roles_by_admin_role(self):
         if not self.is_admin:
-            return {*self.roles, PortalRole.ROLE_PORTAL_ADMIN}
+            return self.role_mask | PortalRole.ROLE_PORTAL_ADMIN.bit
 
     def remove_admin_privileges_from_model(self):
         if self.is_admin:
-            return {role for role in self.roles if role != PortalRole.ROLE_PORTAL_ADMIN}
+            return self.role_mask & ~PortalRole.ROLE_PORTAL_ADMIN.bit
+
+
+# Колонки пользователя, нужные для аутентификации и проверки прав
+AUTH_COLUMNS = ["user_id", "is_active", "hashed_password", "role_mask", "token_version"]
+
+
+class User(UserRolesMixin, Base):
+    __tablename__ = "users"
+
+    user_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String, nullable=False)
+    surname = Column(String, nullable=False)
+    # в нижнем регистре (api.schemas.normalize_email)
+    email = Column(String, nullable=False)
+    is_active = Column(Boolean(), default=True)
+    hashed_password = Column(String, nullable=False)
+    role_mask = Column(
+        SmallInteger, nullable=False, default=PortalRole.ROLE_PORTAL_USER.bit
+    )
+    # Увеличивается при изменениях, делающих выданные токены недействительными
+    token_version = Column(Integer, nullable=False, default=0)
+    # Версия строки для ETag: увеличивается при каждом изменении через API
+    version = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # уникальность email и поиск при аутентификации: все колонки,
+        # которые читает UserDAL.get_auth_user_by_email, есть в индексе,
+        # поэтому запрос выполняется index-only scan
+        Index(
+            "ix_users_email",
+            "email",
+            unique=True,
+            postgresql_include=AUTH_COLUMNS,
+        ),
+        # постраничный вывод с фильтром по активности
+        Index("ix_users_is_active_user_id", "is_active", "user_id"),
+        # выборки админов и суперадминов: частичные индексы с тем же
+        # условием, что и в запросах UserDAL (бит подставляется литералом)
+        Index(
+            "ix_users_admin_user_id",
+            "user_id",
+            postgresql_where=text(
+                f"(role_mask & {PortalRole.ROLE_PORTAL_ADMIN.bit}) <> 0"
+            ),
+        ),
+        Index(
+            "ix_users_superadmin_user_id",
+            "user_id",
+            postgresql_where=text(
+                f"(role_mask & {PortalRole.ROLE_PORTAL_SUPERADMIN.bit}) <> 0"
+            ),
+        ),
+    )
+
+
+class RefreshToken(Base):
+    """Issued refresh token, stored as sha256 of the token"""
+
+    __tablename__ = "refresh_tokens"
+
+    token_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("users.user_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    token_hash = Column(String(64), nullable=False, unique=True)
+    # token_version пользователя на момент выдачи: его увеличение
+    # отзывает и refresh-токены
+    token_version = Column(Integer, nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    # время ротации или отзыва, NULL - токен действителен
+    revoked_at = Column(DateTime(timezone=True))
+
+
+class UserRow(UserRolesMixin):
+    """Read-only copy of a users row which is not bound to any session.
+
+    Safe to keep between requests, unlike ORM objects that are expired
+    on rollback of their session.
+    """
+
+    __slots__ = (
+        "user_id",
+        "name",
+        "surname",
+        "email",
+        "is_active",
+        "hashed_password",
+        "role_mask",
+        "token_version",
+        "version",
+    )
+
+    def __init__(
+        self,
+        user_id: uuid.UUID,
+        name: Optional[str] = None,
+        surname: Optional[str] = None,
+        email: Optional[str] = None,
+        is_active: Optional[bool] = True,
+        hashed_password: Optional[str] = None,
+        role_mask: int = 0,
+        token_version: int = 0,
+        version: int = 0,
+    ):
+        self.user_id = user_id
+        self.name = name
+        self.surname = surname
+        self.email = email
+        self.is_active = is_active
+        self.hashed_password = hashed_password
+        self.role_mask = role_mask
+        self.token_version = token_version
+        self.version = version
+
+    @classmethod
+    def from_orm(cls, user: User) -> "UserRow":
+        return cls(
+            user_id=user.user_id,
+            name=user.name,
+            surname=user.surname,
+            email=user.email,
+            is_active=user.is_active,
+            hashed_password=user.hashed_password,
+            role_mask=user.role_mask,
+            token_version=user.token_version,
+            version=user.version,
+        )
@@ -1,32 +1,363 @@
-from typing import Generator
+from contextlib import asynccontextmanager
+from itertools import cycle
+from logging import getLogger
+from time import monotonic
+from time import perf_counter
+from typing import AsyncGenerator
+from typing import AsyncIterator
+from typing import Callable
+from typing import Optional
 
+from fastapi import HTTPException
+from fastapi import Request
+from fastapi import Response
+from fastapi.routing import APIRoute
+from sqlalchemy import exc
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue
 
 import settings
+from db.instrumentation import instrument_engine
+from metrics import DB_POOL_CHECKED_OUT
+from metrics import DB_POOL_CHECKOUT_TIMEOUTS
+from metrics import DB_POOL_CHECKOUT_WAIT
+from metrics import DB_POOL_OVERFLOW
+from metrics import DB_POOL_SIZE
+from metrics import DB_REPLICA_LAG
+from metrics import DB_REPLICA_READS
+
+logger = getLogger(__name__)
 
 
 ##############################################
 # BLOCK FOR COMMON INTERACTION WITH DATABASE #
 ##############################################
 
+
+class InstrumentedQueue(AsyncAdaptedQueue):
+    """Queue of pooled connections which measures waiting for a free one"""
+
+    metrics_name = "primary"
+
+    def get(self, block=True, timeout=None):
+        # открытие нового соединения сюда не входит: пул делает его после
+        # неудачного get, когда лимит соединений ещё не достигнут
+        start = perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            DB_POOL_CHECKOUT_WAIT.labels(self.metrics_name).observe(
+                perf_counter() - start
+            )
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Connection pool which measures waiting for a free connection"""
+
+    _queue_class = InstrumentedQueue
+    metrics_name = "primary"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool.metrics_name = self.metrics_name
+
+    def connect(self):
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            DB_POOL_CHECKOUT_TIMEOUTS.labels(self.metrics_name).inc()
+            raise
+
+
+def create_engine(url: str, metrics_name: str) -> AsyncEngine:
+    pool_class = type(
+        "InstrumentedQueuePool",
+        (InstrumentedQueuePool,),
+        {"metrics_name": metrics_name},
+    )
+    new_engine = create_async_engine(
+        url,
+        future=True,
+        echo=settings.DB_ECHO,
+        poolclass=pool_class,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={
+            # кэш SQLAlchemy для подготовленных запросов asyncpg
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            # собственный кэш asyncpg
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        },
+    )
+
+    instrument_engine(new_engine.sync_engine)
+
+    # пул может быть пересоздан (engine.dispose()), поэтому он берётся
+    # из engine при каждом чтении метрики
+    def pool():
+        return new_engine.sync_engine.pool
+
+    DB_POOL_SIZE.labels(metrics_name).set_function(lambda: pool().size())
+    DB_POOL_CHECKED_OUT.labels(metrics_name).set_function(lambda: pool().checkedout())
+    DB_POOL_OVERFLOW.labels(metrics_name).set_function(
+        lambda: max(pool().overflow(), 0)
+    )
+
+    return new_engine
+
+
 # create async engine for interaction with database
-engine = create_async_engine(
-    settings.REAL_DATABASE_URL,
-    future=True,
-    echo=True,
-    execution_options={"isolation_level": "AUTOCOMMIT"},
-)
+engine = create_engine(settings.REAL_DATABASE_URL, metrics_name="primary")
+
+
+class ReplicaSet:
+    """Read replicas chosen in turn, skipping lagging or unavailable ones"""
+
+    # позиция WAL (в байтах), до которой реплика применила изменения, и её
+    # отставание. Реплика, применившая всё полученное, не отстаёт, даже если
+    # последняя транзакция была давно: время простоя primary не считается.
+    # Вне восстановления (реплика стала primary) берётся текущая позиция.
+    STATE_QUERY = text(
+        "SELECT "
+        "CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() "
+        "ELSE pg_current_wal_lsn() END - '0/0'::pg_lsn, "
+        "CASE WHEN NOT pg_is_in_recovery() "
+        "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE("
+        "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0"
+        ") END"
+    )
+
+    def __init__(self, urls: list[str]):
+        self.engines = [
+            create_engine(url, metrics_name=f"replica{number}")
+            for number, url in enumerate(urls)
+        ]
+        self._order = cycle(range(len(self.engines)))
+        self._lag = [0.0] * len(self.engines)
+        self._replayed_lsn = [-1] * len(self.engines)
+        self._checked_at = [float("-inf")] * len(self.engines)
+
+    async def choose(self, written_lsn: Optional[int] = None) -> Optional[AsyncEngine]:
+        """Next replica with acceptable lag or None to read from primary.
+
+        With written_lsn (WAL position of a commit on primary) only replicas
+        which have replayed WAL up to it are chosen.
+        """
+        for _ in range(len(self.engines)):
+            number = next(self._order)
+
+            if monotonic() - self._checked_at[number] >= (
+                settings.REPLICA_LAG_CHECK_INTERVAL_SECONDS
+            ):
+                await self._check_state(number)
+
+            if self._lag[number] > settings.REPLICA_MAX_LAG_SECONDS:
+                continue
+
+            # позиция устаревает только в безопасную сторону: реплика могла
+            # применить и более поздние изменения
+            if written_lsn is None or self._replayed_lsn[number] >= written_lsn:
+                return self.engines[number]
+
+        return None
+
+    async def _check_state(self, number: int) -> None:
+        # отметка ставится до запроса, чтобы параллельные запросы
+        # не проверяли одну реплику одновременно
+        self._checked_at[number] = monotonic()
+        try:
+            async with self.engines[number].connect() as connection:
+                replayed_lsn, lag = (await connection.execute(self.STATE_QUERY)).one()
+        except Exception as err:
+            logger.warning("Replica %s is unavailable: %s", number, err)
+            replayed_lsn, lag = -1, float("inf")
+
+        self._replayed_lsn[number] = int(replayed_lsn)
+        self._lag[number] = float(lag)
+        DB_REPLICA_LAG.labels(f"replica{number}").set(self._lag[number])
+
+
+replicas = ReplicaSet(settings.REPLICA_DATABASE_URLS)
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Позиция WAL последнего изменения данных клиентом хранится у клиента,
+# поэтому её видят все процессы и экземпляры приложения. Она сравнивается
+# с позицией реплик, а не со временем: часы приложения и базы могут
+# расходиться
+WRITTEN_LSN_COOKIE = "db_written_lsn"
+CURRENT_WAL_LSN_QUERY = text("SELECT pg_current_wal_lsn() - '0/0'::pg_lsn")
+
+
+def _get_written_lsn(request: Request) -> Optional[int]:
+    try:
+        return int(request.cookies[WRITTEN_LSN_COOKIE])
+    except (KeyError, ValueError):
+        return None
+
+
+def _set_written_lsn(response: Response, written_lsn: int) -> None:
+    # cookie живёт READ_YOUR_WRITES_SECONDS, дальше чтения снова идут
+    # с любой не отстающей реплики
+    response.set_cookie(
+        WRITTEN_LSN_COOKIE,
+        str(written_lsn),
+        max_age=int(settings.READ_YOUR_WRITES_SECONDS) + 1,
+        httponly=True,
+        samesite="lax",
+    )
+
+
+# Больше любой позиции WAL: клиент читает только с primary
+UNKNOWN_LSN = 2**64
+
+
+async def _current_wal_lsn(session: AsyncSession) -> int:
+    """WAL position of primary, not earlier than the last commit"""
+    try:
+        written_lsn = (await session.execute(CURRENT_WAL_LSN_QUERY)).scalar_one()
+        await session.commit()
+    except exc.SQLAlchemyError as err:
+        # изменение уже зафиксировано, поэтому запрос не считается неудачным
+        logger.warning("Could not get WAL position of the commit: %s", err)
+        await session.rollback()
+        return UNKNOWN_LSN
+
+    return int(written_lsn)
+
+
+REPLICA_ENGINE = "replica_engine"
+# Запросы, которые можно выполнить на реплике, помечаются
+# .execution_options(replica_ok=True)
+REPLICA_OK = "replica_ok"
+
+
+class RoutingSession(Session):
+    """Sends statements marked replica_ok to the replica of the request"""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get(REPLICA_ENGINE)
+
+        if (
+            replica is not None
+            and clause is not None
+            and not self._flushing
+            and clause.get_execution_options().get(REPLICA_OK)
+        ):
+            DB_REPLICA_READS.inc()
+            return replica.sync_engine
+
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
 
 # create session for the interaction with database
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+async_session = sessionmaker(
+    engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+)
+
+AFTER_COMMIT_CALLBACKS = "after_commit_callbacks"
+
+
+def call_after_commit(session: AsyncSession, callback: Callable, *args) -> None:
+    """Run callback when the request transaction is committed"""
+    session.info.setdefault(AFTER_COMMIT_CALLBACKS, []).append((callback, args))
+
+
+async def commit_unit_of_work(session: AsyncSession) -> None:
+    """Commit the transaction and run callbacks registered for it"""
+    await session.commit()
+
+    for callback, args in session.info.pop(AFTER_COMMIT_CALLBACKS, []):
+        callback(*args)
 
 
-async def get_db() -> Generator:
+@asynccontextmanager
+async def unit_of_work(session_factory: sessionmaker) -> AsyncIterator[AsyncSession]:
+    """One session and at most one transaction for the whole request.
+
+    The transaction is started by the first query (for example the user
+    lookup during authentication) and the following queries of the request
+    reuse its connection. It is committed once when the request is
+    processed or rolled back on error.
+    """
+    async with session_factory() as session:
+        try:
+            yield session
+            await commit_unit_of_work(session)
+        except Exception:
+            await session.rollback()
+            raise
+
+
+@asynccontextmanager
+async def request_unit_of_work(
+    request: Request, session_factory: sessionmaker
+) -> AsyncIterator[AsyncSession]:
+    """unit_of_work of the request, committed by UnitOfWorkRoute.
+
+    Only requests which do not change data read from replicas: requests
+    with other methods work with primary, so they never decide on stale
+    data. After a change the client reads only from replicas which have
+    replayed it, for READ_YOUR_WRITES_SECONDS.
+    """
+    async with unit_of_work(session_factory) as session:
+        request.state.db_session = session
+
+        if replicas.engines and request.method in SAFE_METHODS:
+            session.info[REPLICA_ENGINE] = await replicas.choose(
+                written_lsn=_get_written_lsn(request)
+            )
+
+        yield session
+
+
+class UnitOfWorkRoute(APIRoute):
+    """Commits the request transaction before the response is sent.
+
+    FastAPI finishes dependencies with yield only after the response is
+    sent, so a commit in get_db could fail after the client was told that
+    the request succeeded.
+    """
+
+    def get_route_handler(self) -> Callable:
+        route_handler = super().get_route_handler()
+
+        async def commit_and_respond(request: Request) -> Response:
+            response = await route_handler(request)
+            session = getattr(request.state, "db_session", None)
+
+            if session is not None:
+                try:
+                    await commit_unit_of_work(session)
+                except exc.SQLAlchemyError as err:
+                    logger.error("Commit of the request failed: %s", err)
+                    # транзакция откатывается в unit_of_work
+                    raise HTTPException(
+                        status_code=503, detail="Database error, try again later."
+                    )
+
+                if replicas.engines and request.method not in SAFE_METHODS:
+                    _set_written_lsn(response, await _current_wal_lsn(session))
+
+            return response
+
+        return commit_and_respond
+
+
+async def get_db(request: Request) -> AsyncGenerator:
     """Dependency for getting async session"""
-    try:
-        session: AsyncSession = async_session()
+    async with request_unit_of_work(request, async_session) as session:
         yield session
-    finally:
-        await session.close()
@@ -0,0 +1,35 @@
+"""Export users table to NDJSON or CSV.
+
+Usage: python export_users.py --format csv --output users.csv
+"""
+import argparse
+import asyncio
+import sys
+
+from api.actions.user import _export_users
+from db.session import async_session
+
+
+async def export_users(export_format: str, output) -> None:
+    async with async_session() as session:
+        async for chunk in _export_users(session, export_format):
+            output.write(chunk)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export users table")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument(
+        "--output", default="-", help="output file, '-' for standard output"
+    )
+    args = parser.parse_args()
+
+    if args.output == "-":
+        asyncio.run(export_users(args.format, sys.stdout.buffer))
+    else:
+        with open(args.output, "wb") as output:
+            asyncio.run(export_users(args.format, output))
+
+
+if __name__ == "__main__":
+    main()
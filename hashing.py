@@ -1,13 +1,128 @@
+import asyncio
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Optional
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import settings
+from metrics import HASHING_DURATION
+from metrics import HASHING_PENDING
+from metrics import HASHING_REJECTED
+
+
+def create_pwd_context(
+    scheme: str = settings.PASSWORD_HASH_SCHEME,
+    bcrypt_rounds: int = settings.BCRYPT_ROUNDS,
+    argon2_memory_cost: int = settings.ARGON2_MEMORY_COST,
+    argon2_time_cost: int = settings.ARGON2_TIME_COST,
+    argon2_parallelism: int = settings.ARGON2_PARALLELISM,
+) -> CryptContext:
+    """Context hashing with scheme and cost from settings.
+
+    All supported schemes are accepted for verification, so passwords
+    hashed before switching the scheme in either direction still work.
+    Hashes made with another scheme or cost are reported by needs_update.
+    """
+    return CryptContext(
+        # схемы не удаляются из списка, а помечаются устаревшими (deprecated)
+        schemes=["bcrypt", "argon2"],
+        default=scheme,
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__time_cost=argon2_time_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
+
+
+pwd_context = create_pwd_context()
+
+
+class HashingQueueFull(Exception):
+    """Too many hashing jobs are waiting for the worker pool"""
+
+
+# Функции уровня модуля, чтобы их можно было передать в ProcessPoolExecutor
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
 
 
 class Hasher:
+    _executor: Optional[Executor] = None
+    _pending: int = 0
+
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str):
-        return pwd_context.verify(plain_password, hashed_password)
+        return _verify_password(plain_password, hashed_password)
 
     @staticmethod
     def get_password_hash(password: str) -> str:
-        return pwd_context.hash(password)
+        return _get_password_hash(password)
+
+    @staticmethod
+    def needs_update(hashed_password: str) -> bool:
+        """Whether the hash was made with another scheme or cost"""
+        return pwd_context.needs_update(hashed_password)
+
+    @classmethod
+    async def verify_password_async(
+        cls, plain_password: str, hashed_password: str
+    ) -> bool:
+        """Verify password in the worker pool without blocking the event loop"""
+        return await cls._run_in_pool(
+            "verify", _verify_password, plain_password, hashed_password
+        )
+
+    @classmethod
+    async def get_password_hash_async(cls, password: str) -> str:
+        """Hash password in the worker pool without blocking the event loop"""
+        return await cls._run_in_pool("hash", _get_password_hash, password)
+
+    @classmethod
+    def _get_executor(cls) -> Executor:
+        if cls._executor is None:
+            if settings.HASHING_POOL_KIND == "process":
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=settings.HASHING_POOL_WORKERS
+                )
+            else:
+                # bcrypt отпускает GIL, поэтому потоков достаточно
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=settings.HASHING_POOL_WORKERS,
+                    thread_name_prefix="hasher",
+                )
+        return cls._executor
+
+    @classmethod
+    async def _run_in_pool(cls, operation: str, func, *args):
+        # Ограничение очереди: лишние запросы отклоняются сразу, а не копятся
+        # в пуле, увеличивая время ответа для всех остальных.
+        if cls._pending >= settings.HASHING_MAX_PENDING:
+            HASHING_REJECTED.labels(operation).inc()
+            raise HashingQueueFull(
+                f"{cls._pending} hashing jobs are already pending.",
+            )
+
+        cls._pending += 1
+        HASHING_PENDING.inc()
+        start = perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(cls._get_executor(), func, *args)
+        finally:
+            cls._pending -= 1
+            HASHING_PENDING.dec()
+            HASHING_DURATION.labels(operation).observe(perf_counter() - start)
+
+    @classmethod
+    def shutdown(cls) -> None:
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False)
+            cls._executor = None
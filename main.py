@@ -1,14 +1,24 @@
+from logging import getLogger
+
 import sentry_sdk
 import uvicorn
 from fastapi import FastAPI
+from fastapi import Request
 from fastapi.routing import APIRouter
 from starlette_exporter import handle_metrics
 from starlette_exporter import PrometheusMiddleware
 
 import settings
+from admission import AdmissionControlMiddleware
+from admission import AdmissionLimit
+from admission import busy_response
 from api.handlers import user_router
 from api.login_handler import login_router
 from api.service import service_router
+from hashing import Hasher
+from hashing import HashingQueueFull
+
+logger = getLogger(__name__)
 
 
 # sentry configuration
@@ -27,10 +37,52 @@ sentry_sdk.init(
 # create instance of the app
 app = FastAPI(title="University")
 
+# Ограничение одновременных запросов с хешированием паролей, чтобы они
+# не занимали процесс целиком. Добавлено раньше PrometheusMiddleware,
+# чтобы отклонённые запросы попадали в метрики.
+app.add_middleware(
+    AdmissionControlMiddleware,
+    limits={
+        ("POST", "/login/token"): AdmissionLimit(
+            "login",
+            concurrency=settings.LOGIN_MAX_CONCURRENCY,
+            queue_size=settings.LOGIN_MAX_QUEUE,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        ),
+        ("POST", "/user/"): AdmissionLimit(
+            "signup",
+            concurrency=settings.SIGNUP_MAX_CONCURRENCY,
+            queue_size=settings.SIGNUP_MAX_QUEUE,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        ),
+        # пакет занимает пул хеширования надолго, поэтому лимит отдельный
+        ("POST", "/user/bulk"): AdmissionLimit(
+            "bulk_signup",
+            concurrency=settings.BULK_SIGNUP_MAX_CONCURRENCY,
+            queue_size=settings.BULK_SIGNUP_MAX_QUEUE,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        ),
+    },
+    retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS,
+)
+
 # Реализация сбора метрик для Prometeus
 app.add_middleware(PrometheusMiddleware)
 app.add_route("/metrics", handle_metrics)
 
+
+# Переполненный пул хеширования - та же перегрузка, что и в admission control
+@app.exception_handler(HashingQueueFull)
+async def hashing_queue_full_handler(request: Request, err: HashingQueueFull):
+    logger.warning(err)
+    return busy_response(settings.ADMISSION_RETRY_AFTER_SECONDS)
+
+
+@app.on_event("shutdown")
+def shutdown_hashing_pool():
+    Hasher.shutdown()
+
+
 # create the instance for the routes
 main_api_router = APIRouter()
 
@@ -0,0 +1,123 @@
+"""Application metrics for Prometheus.
+
+Metrics are registered in the default registry of prometheus_client,
+so they are exported by the /metrics route of starlette_exporter.
+"""
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+
+
+####################
+# PASSWORD HASHING #
+####################
+
+HASHING_PENDING = Gauge(
+    "hashing_pending_jobs",
+    "Password hashing jobs submitted to the worker pool and not finished yet",
+)
+HASHING_DURATION = Histogram(
+    "hashing_duration_seconds",
+    "Time from submitting a hashing job to the pool until its result",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+HASHING_REJECTED = Counter(
+    "hashing_rejected_total",
+    "Hashing jobs rejected because the pool queue was full",
+    ["operation"],
+)
+
+
+##########
+# CACHES #
+##########
+
+CACHE_HITS = Counter("cache_hits_total", "In-process cache hits", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "In-process cache misses", ["cache"])
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total",
+    "Entries removed from in-process cache",
+    ["cache", "reason"],
+)
+
+
+############################
+# DATABASE CONNECTION POOL #
+############################
+
+DB_POOL_SIZE = Gauge("db_pool_size", "Connections kept in the pool", ["pool"])
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool", ["pool"]
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections opened above the pool size", ["pool"]
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time waiting for a free connection in the pool, without connecting",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Connection requests failed because the pool was exhausted",
+    ["pool"],
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds",
+    "Replication lag measured at the last check of the replica",
+    ["pool"],
+)
+DB_REPLICA_READS = Counter(
+    "db_replica_reads_total", "Read statements executed on replicas"
+)
+
+
+#####################
+# ADMISSION CONTROL #
+#####################
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight_requests",
+    "Requests admitted to a limited route and not finished yet",
+    ["route"],
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Requests waiting for a free slot of a limited route",
+    ["route"],
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds",
+    "Time requests waited in the queue of a limited route",
+    ["route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests rejected by admission control",
+    ["route", "reason"],
+)
+
+
+#######################
+# DATABASE STATEMENTS #
+#######################
+
+DB_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds",
+    "Execution time of database statements by the DAL method issuing them",
+    ["method"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+DB_STATEMENT_ROWS = Counter(
+    "db_statement_rows_total",
+    "Rows returned by DAL methods",
+    ["method"],
+)
+DB_STATEMENT_ERRORS = Counter(
+    "db_statement_errors_total",
+    "Database statements failed with an error",
+    ["method"],
+)
@@ -0,0 +1,29 @@
+"""added covering email index
+
+Revision ID: 1d6c1d2508ca
+Revises: b50872fb1e31
+Create Date: 2026-10-18 15:52:13.604127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d6c1d2508ca'
+down_revision = 'b50872fb1e31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # email хранится в нижнем регистре; при совпадающих без учёта регистра
+    # адресах миграция остановится на уникальном индексе
+    op.execute("UPDATE users SET email = lower(email) WHERE email <> lower(email)")
+    op.create_index('ix_users_email', 'users', ['email'], unique=True, postgresql_include=['user_id', 'is_active', 'hashed_password', 'role_mask', 'token_version'])
+    op.drop_constraint('users_email_key', 'users', type_='unique')
+
+
+def downgrade() -> None:
+    op.create_unique_constraint('users_email_key', 'users', ['email'])
+    op.drop_index('ix_users_email', table_name='users')
@@ -0,0 +1,56 @@
+"""replaced roles with role mask
+
+Revision ID: b50872fb1e31
+Revises: 8801897cc87a
+Create Date: 2026-10-18 15:06:48.902731
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'b50872fb1e31'
+down_revision = '8801897cc87a'
+branch_labels = None
+depends_on = None
+
+# Биты ролей, как в db.models.ROLE_BITS
+ROLE_BITS = {
+    'ROLE_PORTAL_USER': 1,
+    'ROLE_PORTAL_ADMIN': 2,
+    'ROLE_PORTAL_SUPERADMIN': 4,
+}
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('role_mask', sa.SmallInteger(), nullable=False, server_default='0'))
+    op.execute(
+        "UPDATE users SET role_mask = "
+        + " | ".join(
+            f"(CASE WHEN '{role}' = ANY(roles) THEN {bit} ELSE 0 END)"
+            for role, bit in ROLE_BITS.items()
+        )
+    )
+    op.alter_column('users', 'role_mask', server_default=None)
+    op.drop_index('ix_users_roles', table_name='users', postgresql_using='gin')
+    op.drop_column('users', 'roles')
+    op.create_index('ix_users_admin_user_id', 'users', ['user_id'], unique=False, postgresql_where=sa.text('(role_mask & 2) <> 0'))
+    op.create_index('ix_users_superadmin_user_id', 'users', ['user_id'], unique=False, postgresql_where=sa.text('(role_mask & 4) <> 0'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_superadmin_user_id', table_name='users', postgresql_where=sa.text('(role_mask & 4) <> 0'))
+    op.drop_index('ix_users_admin_user_id', table_name='users', postgresql_where=sa.text('(role_mask & 2) <> 0'))
+    op.add_column('users', sa.Column('roles', postgresql.ARRAY(sa.String()), nullable=False, server_default='{}'))
+    op.execute(
+        "UPDATE users SET roles = array_remove(ARRAY["
+        + ", ".join(
+            f"CASE WHEN role_mask & {bit} <> 0 THEN '{role}' END"
+            for role, bit in ROLE_BITS.items()
+        )
+        + "]::varchar[], NULL)"
+    )
+    op.alter_column('users', 'roles', server_default=None)
+    op.create_index('ix_users_roles', 'users', ['roles'], unique=False, postgresql_using='gin')
+    op.drop_column('users', 'role_mask')
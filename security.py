@@ -1,10 +1,15 @@
+import hashlib
+import secrets
 from datetime import datetime
 from datetime import timedelta
 from typing import Optional
+from uuid import UUID
 
 from jose import jwt
 
 import settings
+from db.models import User
+from db.models import UserRow
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -23,3 +28,34 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     )
 
     return encoded_jwt
+
+
+def get_user_claims(user: User) -> dict:
+    """Claims which allow to authorize the user without loading it"""
+    return {
+        "sub": user.email,
+        "uid": str(user.user_id),
+        # та же битовая маска, что хранится в users.role_mask
+        "rl": user.role_mask,
+        "ver": user.token_version,
+    }
+
+
+def get_principal_from_claims(payload: dict) -> Optional[UserRow]:
+    try:
+        return UserRow(
+            user_id=UUID(payload["uid"]),
+            email=payload["sub"],
+            role_mask=int(payload["rl"]),
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def create_refresh_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def hash_refresh_token(token: str) -> str:
+    """Refresh tokens are random, so a fast hash is enough to store them"""
+    return hashlib.sha256(token.encode()).hexdigest()
@@ -15,10 +15,113 @@ REAL_DATABASE_URL = env.str(
 )
 APP_PORT = env.int("APP_PORT", default=8000)
 
+# Пул соединений с базой данных (на каждый процесс приложения)
+DB_ECHO: bool = env.bool("DB_ECHO", default=False)
+DB_POOL_SIZE: int = env.int("DB_POOL_SIZE", default=5)
+DB_MAX_OVERFLOW: int = env.int("DB_MAX_OVERFLOW", default=10)
+# Сколько секунд ждать свободное соединение
+DB_POOL_TIMEOUT: float = env.float("DB_POOL_TIMEOUT", default=30.0)
+# Пересоздавать соединения старше указанного числа секунд, -1 - никогда
+DB_POOL_RECYCLE: int = env.int("DB_POOL_RECYCLE", default=-1)
+# Проверять соединение перед выдачей из пула
+DB_POOL_PRE_PING: bool = env.bool("DB_POOL_PRE_PING", default=False)
+# Размер кэша подготовленных запросов asyncpg на соединение
+DB_STATEMENT_CACHE_SIZE: int = env.int("DB_STATEMENT_CACHE_SIZE", default=100)
+# Реализация UserDAL: "orm" (SQLAlchemy ORM) или "asyncpg" (частые чтения
+# выполняются напрямую через asyncpg)
+USER_DAL_BACKEND: str = env.str("USER_DAL_BACKEND", default="orm")
+
+# Реплики для чтения, через запятую. Если не заданы, всё читается с primary.
+REPLICA_DATABASE_URLS: list = env.list("REPLICA_DATABASE_URLS", default=[])
+# Реплика с отставанием больше указанного не используется
+REPLICA_MAX_LAG_SECONDS: float = env.float("REPLICA_MAX_LAG_SECONDS", default=1.0)
+REPLICA_LAG_CHECK_INTERVAL_SECONDS: float = env.float(
+    "REPLICA_LAG_CHECK_INTERVAL_SECONDS", default=5.0
+)
+# Сколько секунд после изменения данных клиент читает только с реплик,
+# применивших это изменение (или с primary)
+READ_YOUR_WRITES_SECONDS: float = env.float("READ_YOUR_WRITES_SECONDS", default=5.0)
+
 SECRET_KEY: str = env.str("SECRET_KEY", default="secret_key")
 ALGORITHM: str = env.str("ALGORITHM", default="HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES: int = env.int("ACCESS_TOKEN_EXPIRE_MINUTES", default=30)
+# Срок действия refresh-токена, по которому выдаётся новый access-токен
+# без проверки пароля
+REFRESH_TOKEN_EXPIRE_DAYS: int = env.int("REFRESH_TOKEN_EXPIRE_DAYS", default=30)
+# Сколько часов хранится отозванный refresh-токен: его повторное
+# предъявление отзывает все токены пользователя. Более старые отозванные
+# и истёкшие токены удаляются при выдаче нового токена пользователю.
+REFRESH_TOKEN_REVOKED_KEEP_HOURS: int = env.int(
+    "REFRESH_TOKEN_REVOKED_KEEP_HOURS", default=24
+)
 SENTRY_URL: str = env.str("SENTRY_URL")
+# Выдавать токены с id, ролями и версией токена пользователя, чтобы
+# авторизация не требовала загрузки пользователя из базы
+JWT_SELF_CONTAINED_CLAIMS: bool = env.bool("JWT_SELF_CONTAINED_CLAIMS", default=False)
+
+# Схема хеширования паролей: "bcrypt" или "argon2".
+# Пароли, захешированные с другой схемой или стоимостью, перехешируются
+# при входе пользователя. Подобрать значения: python calibrate_hashing.py
+PASSWORD_HASH_SCHEME: str = env.str("PASSWORD_HASH_SCHEME", default="bcrypt")
+BCRYPT_ROUNDS: int = env.int("BCRYPT_ROUNDS", default=12)
+# Память argon2 в КиБ, число проходов и потоков
+ARGON2_MEMORY_COST: int = env.int("ARGON2_MEMORY_COST", default=65536)
+ARGON2_TIME_COST: int = env.int("ARGON2_TIME_COST", default=3)
+ARGON2_PARALLELISM: int = env.int("ARGON2_PARALLELISM", default=4)
+
+# Пул для хеширования паролей: "thread" или "process"
+HASHING_POOL_KIND: str = env.str("HASHING_POOL_KIND", default="thread")
+HASHING_POOL_WORKERS: int = env.int("HASHING_POOL_WORKERS", default=4)
+# Максимальное число заданий в пуле (выполняемых и ожидающих)
+HASHING_MAX_PENDING: int = env.int("HASHING_MAX_PENDING", default=64)
+
+# Ограничение числа одновременных запросов к маршрутам с хешированием
+# паролей (на процесс). Запросы сверх лимита ждут в очереди не дольше
+# ADMISSION_QUEUE_TIMEOUT_SECONDS, при переполнении очереди получают 503.
+LOGIN_MAX_CONCURRENCY: int = env.int("LOGIN_MAX_CONCURRENCY", default=8)
+LOGIN_MAX_QUEUE: int = env.int("LOGIN_MAX_QUEUE", default=32)
+SIGNUP_MAX_CONCURRENCY: int = env.int("SIGNUP_MAX_CONCURRENCY", default=4)
+SIGNUP_MAX_QUEUE: int = env.int("SIGNUP_MAX_QUEUE", default=16)
+BULK_SIGNUP_MAX_CONCURRENCY: int = env.int("BULK_SIGNUP_MAX_CONCURRENCY", default=1)
+BULK_SIGNUP_MAX_QUEUE: int = env.int("BULK_SIGNUP_MAX_QUEUE", default=2)
+ADMISSION_QUEUE_TIMEOUT_SECONDS: float = env.float(
+    "ADMISSION_QUEUE_TIMEOUT_SECONDS", default=5.0
+)
+ADMISSION_RETRY_AFTER_SECONDS: int = env.int("ADMISSION_RETRY_AFTER_SECONDS", default=1)
+
+# Кэш пользователей, определённых по токену. Размер 0 отключает кэш.
+PRINCIPAL_CACHE_SIZE: int = env.int("PRINCIPAL_CACHE_SIZE", default=10000)
+PRINCIPAL_CACHE_TTL_SECONDS: float = env.float(
+    "PRINCIPAL_CACHE_TTL_SECONDS", default=30.0
+)
+
+# Кэш проверенных JWT (claims хранятся до истечения токена).
+# Размер 0 отключает кэш.
+VERIFIED_TOKEN_CACHE_SIZE: int = env.int("VERIFIED_TOKEN_CACHE_SIZE", default=10000)
+
+# Время, в течение которого отозванный токен с claims ещё может быть принят
+# другими процессами приложения
+TOKEN_VERSION_CACHE_TTL_SECONDS: float = env.float(
+    "TOKEN_VERSION_CACHE_TTL_SECONDS", default=5.0
+)
+
+# Массовое создание пользователей
+BULK_CREATE_MAX_ROWS: int = env.int("BULK_CREATE_MAX_ROWS", default=10000)
+# Число строк в одном INSERT (ограничено числом параметров запроса)
+BULK_INSERT_CHUNK_SIZE: int = env.int("BULK_INSERT_CHUNK_SIZE", default=1000)
+
+# Ответы /user кодируются orjson напрямую из строк базы, без повторной
+# проверки через response_model
+FAST_JSON_RESPONSES: bool = env.bool("FAST_JSON_RESPONSES", default=False)
+
+# Максимальное число пользователей в массовых изменениях
+BULK_UPDATE_MAX_IDS: int = env.int("BULK_UPDATE_MAX_IDS", default=10000)
+
+# Максимальный размер страницы списка пользователей
+USER_LIST_MAX_LIMIT: int = env.int("USER_LIST_MAX_LIMIT", default=500)
+
+# Число строк, читаемых из курсора за раз при выгрузке пользователей
+EXPORT_BATCH_SIZE: int = env.int("EXPORT_BATCH_SIZE", default=1000)
 
 # test envs
 TEST_DATABASE_URL = env.str(
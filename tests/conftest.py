@@ -5,19 +5,27 @@ from typing import Generator
 
 import asyncpg
 import pytest
+from fastapi import Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
 from starlette.testclient import TestClient
 
 import settings
+from api.actions.auth import principal_cache
+from api.actions.auth import token_version_cache
+from api.actions.auth import verified_token_cache
 from db.dals import PortalRole
+from db.models import roles_to_mask
 from db.session import get_db
+from db.session import request_unit_of_work
+from db.session import RoutingSession
 from main import app
 from security import create_access_token
 
 CLEAN_TABLES = [
     "users",
+    "refresh_tokens",
 ]
 
 
@@ -47,36 +55,44 @@ async def clean_tables(async_session_test):
     """Clean data in all tables before running test function"""
     async with async_session_test() as session:
         async with session.begin():
-            for table_for_cleaning in CLEAN_TABLES:
-                await session.execute(f"""TRUNCATE TABLE {table_for_cleaning};""")
+            # одной командой, так как refresh_tokens ссылается на users
+            await session.execute(f"""TRUNCATE TABLE {", ".join(CLEAN_TABLES)};""")
 
 
-async def _get_test_db():
-    try:
-        # create async engine for interaction with database
-        test_engine = create_async_engine(
-            settings.TEST_DATABASE_URL, future=True, echo=True
-        )
-
-        # create session for the interaction with database
-        test_async_session = sessionmaker(
-            test_engine, expire_on_commit=False, class_=AsyncSession
-        )
+async def _get_test_db(request: Request):
+    # create async engine for interaction with database
+    test_engine = create_async_engine(
+        settings.TEST_DATABASE_URL, future=True, echo=True
+    )
 
-        yield test_async_session()
+    # create session for the interaction with database
+    # как db.session.async_session, иначе чтения не направляются на реплику
+    test_async_session = sessionmaker(
+        test_engine,
+        expire_on_commit=False,
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+    )
 
-    finally:
-        pass
+    # транзакция на запрос, как в get_db
+    async with request_unit_of_work(request, test_async_session) as session:
+        yield session
 
 
-@pytest.fixture(scope="function")
-async def client() -> Generator[TestClient, Any, None]:
+# тесты обработчиков выполняются с каждой реализацией UserDAL
+@pytest.fixture(scope="function", params=["orm", "asyncpg"])
+async def client(request, monkeypatch) -> Generator[TestClient, Any, None]:
     """
     Create a new FastAPI TestClient that uses the 'db_session'
     fiture to override the 'get_db' dependency that is injected
     into routes.
     """
+    monkeypatch.setattr(settings, "USER_DAL_BACKEND", request.param)
     app.dependency_overrides[get_db] = _get_test_db
+    # таблицы очищаются перед каждым тестом, поэтому и кэш тоже
+    principal_cache.clear()
+    token_version_cache.clear()
+    verified_token_cache.clear()
     with TestClient(app) as client:
         yield client
 
@@ -120,14 +136,15 @@ async def create_user_in_database(asyncpg_pool):
     ):
         async with asyncpg_pool.acquire() as connection:
             return await connection.execute(
-                """INSERT INTO users VALUES ($1, $2, $3, $4, $5, $6, $7)""",
+                """INSERT INTO users (user_id, name, surname, email, is_active,
+                hashed_password, role_mask) VALUES ($1, $2, $3, $4, $5, $6, $7)""",
                 user_id,
                 name,
                 surname,
                 email,
                 is_active,
                 hashed_password,
-                roles,
+                roles_to_mask(roles),
             )
 
     return create_user_in_database
@@ -0,0 +1,35 @@
+from uuid import uuid4
+
+from db.dals import AsyncpgUserDAL
+from db.models import PortalRole
+
+
+async def test_asyncpg_reads_run_in_session_transaction(
+    async_session_test, create_user_in_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Asyncpg",
+        "surname": "User",
+        "email": "asyncpg@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    async with async_session_test() as session:
+        user_dal = AsyncpgUserDAL(session)
+        user = await user_dal.get_auth_user_by_email(user_data["email"])
+        assert user.user_id == user_data["user_id"]
+
+        # чтение мимо SQLAlchemy идёт в транзакции сессии
+        driver_connection = await user_dal._get_driver_connection()
+        assert driver_connection.is_in_transaction()
+        transaction_id = await driver_connection.fetchval("SELECT txid_current()")
+        assert (
+            await driver_connection.fetchval("SELECT txid_current()") == transaction_id
+        )
+
+        await session.commit()
+        assert not driver_connection.is_in_transaction()
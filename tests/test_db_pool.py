@@ -0,0 +1,63 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import exc
+from sqlalchemy import text
+
+import settings
+from db.session import create_engine
+from db.session import InstrumentedQueuePool
+
+POOL = "test_pool"
+
+
+def pool_sample(name: str) -> float:
+    return REGISTRY.get_sample_value(name, {"pool": POOL}) or 0
+
+
+@pytest.fixture
+async def tiny_engine(monkeypatch):
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 0)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT", 0.1)
+    engine = create_engine(settings.TEST_DATABASE_URL, metrics_name=POOL)
+    yield engine
+    await engine.dispose()
+
+
+async def test_pool_settings_reach_engine(monkeypatch):
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 3)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 2)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT", 7.5)
+    engine = create_engine(settings.TEST_DATABASE_URL, metrics_name=POOL)
+
+    pool = engine.sync_engine.pool
+    assert isinstance(pool, InstrumentedQueuePool)
+    assert pool.metrics_name == POOL
+    assert pool.size() == 3
+    assert pool._max_overflow == 2
+    assert pool.timeout() == 7.5
+    await engine.dispose()
+
+
+async def test_pool_metrics(tiny_engine):
+    waits_before = pool_sample("db_pool_checkout_wait_seconds_count")
+    timeouts_before = pool_sample("db_pool_checkout_timeouts_total")
+
+    async with tiny_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+        assert pool_sample("db_pool_size") == 1
+        assert pool_sample("db_pool_checked_out") == 1
+        assert pool_sample("db_pool_overflow") == 0
+
+        # единственное соединение занято, второе не дождётся его
+        wait_sum_before = pool_sample("db_pool_checkout_wait_seconds_sum")
+        with pytest.raises(exc.TimeoutError):
+            async with tiny_engine.connect():
+                pass
+
+        assert pool_sample("db_pool_checkout_timeouts_total") == timeouts_before + 1
+        wait = pool_sample("db_pool_checkout_wait_seconds_sum") - wait_sum_before
+        assert wait >= settings.DB_POOL_TIMEOUT
+
+    assert pool_sample("db_pool_checked_out") == 0
+    assert pool_sample("db_pool_checkout_wait_seconds_count") > waits_before
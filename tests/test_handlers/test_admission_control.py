@@ -0,0 +1,58 @@
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from admission import AdmissionControlMiddleware
+from admission import AdmissionLimit
+
+
+async def slow(request):
+    await asyncio.sleep(0.2)
+    return PlainTextResponse("slow")
+
+
+async def fast(request):
+    return PlainTextResponse("fast")
+
+
+def make_client(limit: AdmissionLimit) -> TestClient:
+    app = Starlette(routes=[Route("/slow", slow), Route("/fast", fast)])
+    app.add_middleware(
+        AdmissionControlMiddleware, limits={("GET", "/slow"): limit}, retry_after=2
+    )
+    return TestClient(app)
+
+
+def test_admission_control_rejects_when_queue_is_full():
+    limit = AdmissionLimit("test", concurrency=0, queue_size=0, queue_timeout=1.0)
+
+    with make_client(limit) as client:
+        resp = client.get("/slow")
+        assert resp.status_code == 503
+        assert resp.headers["Retry-After"] == "2"
+        assert resp.json() == {"detail": "Server is busy, try again later."}
+
+        # маршруты без лимита не ограничиваются
+        resp = client.get("/fast")
+        assert resp.status_code == 200
+
+
+def test_admission_control_rejects_after_queue_timeout():
+    limit = AdmissionLimit("test", concurrency=0, queue_size=1, queue_timeout=0.05)
+
+    with make_client(limit) as client:
+        resp = client.get("/slow")
+        assert resp.status_code == 503
+
+
+def test_admission_control_admits_within_limit():
+    limit = AdmissionLimit("test", concurrency=1, queue_size=0, queue_timeout=1.0)
+
+    with make_client(limit) as client:
+        for _ in range(2):
+            resp = client.get("/slow")
+            assert resp.status_code == 200
+            assert resp.text == "slow"
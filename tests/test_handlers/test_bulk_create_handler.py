@@ -0,0 +1,169 @@
+import json
+from uuid import uuid4
+
+from admission import AdmissionControlMiddleware
+from admission import AdmissionLimit
+from db.models import PortalRole
+from main import app
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_create_users_bulk(
+    client, create_user_in_database, get_user_from_database
+):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Admin",
+        "surname": "Bulk",
+        "email": "admin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    users_data = [
+        {
+            "name": "One",
+            "surname": "User",
+            "email": "one@sdf.com",
+            "password": "SamplePass1!",
+        },
+        # уже зарегистрированный email
+        {
+            "name": "Two",
+            "surname": "User",
+            "email": "admin@sdf.com",
+            "password": "SamplePass1!",
+        },
+        {
+            "name": "123",
+            "surname": "User",
+            "email": "three@sdf.com",
+            "password": "SamplePass1!",
+        },
+        # повтор email внутри пакета
+        {
+            "name": "Four",
+            "surname": "User",
+            "email": "one@sdf.com",
+            "password": "SamplePass1!",
+        },
+    ]
+
+    resp = client.post(
+        "/user/bulk",
+        data=json.dumps(users_data),
+        headers=create_test_auth_headers_for_user(admin_data["email"]),
+    )
+    assert resp.status_code == 200
+    data_from_resp = resp.json()
+    assert data_from_resp["created"] == 1
+    statuses = [result["status"] for result in data_from_resp["results"]]
+    assert statuses == ["created", "conflict", "invalid", "conflict"]
+    assert data_from_resp["results"][2]["detail"] == "Name should contains only letters"
+
+    users_from_db = await get_user_from_database(
+        data_from_resp["results"][0]["user_id"]
+    )
+    assert len(users_from_db) == 1
+    user_from_db = dict(users_from_db[0])
+    assert user_from_db["email"] == users_data[0]["email"]
+    assert user_from_db["is_active"] is True
+    assert user_from_db["hashed_password"] != users_data[0]["password"]
+
+
+async def test_create_users_bulk_ndjson(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Admin",
+        "surname": "Bulk",
+        "email": "admin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_SUPERADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    users_data = [
+        {
+            "name": "User",
+            "surname": f"Ndjson{letter}",
+            "email": f"user{letter}@sdf.com",
+            "password": "SamplePass1!",
+        }
+        for letter in "abc"
+    ]
+
+    resp = client.post(
+        "/user/bulk",
+        data="\n".join(json.dumps(user_data) for user_data in users_data),
+        headers={
+            **create_test_auth_headers_for_user(admin_data["email"]),
+            "Content-Type": "application/x-ndjson",
+        },
+    )
+    assert resp.status_code == 200
+    assert resp.json()["created"] == 3
+
+
+async def test_create_users_bulk_by_user_forbidden(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "User",
+        "surname": "Bulk",
+        "email": "user@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    resp = client.post(
+        "/user/bulk",
+        data=json.dumps([]),
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 403
+    assert resp.json() == {"detail": "Forbidden."}
+
+
+async def test_create_users_bulk_admission_limit(
+    client, create_user_in_database, monkeypatch
+):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Admin",
+        "surname": "Bulk",
+        "email": "admin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    limits = next(
+        middleware.options["limits"]
+        for middleware in app.user_middleware
+        if middleware.cls is AdmissionControlMiddleware
+    )
+    # свободных мест и очереди нет: запрос отклоняется до хеширования
+    monkeypatch.setitem(
+        limits,
+        ("POST", "/user/bulk"),
+        AdmissionLimit("test", concurrency=0, queue_size=0, queue_timeout=1.0),
+    )
+
+    resp = client.post(
+        "/user/bulk",
+        data=json.dumps(
+            [
+                {
+                    "name": "One",
+                    "surname": "User",
+                    "email": "one@sdf.com",
+                    "password": "SamplePass1!",
+                }
+            ]
+        ),
+        headers=create_test_auth_headers_for_user(admin_data["email"]),
+    )
+    assert resp.status_code == 503
+    assert resp.json() == {"detail": "Server is busy, try again later."}
@@ -2,6 +2,8 @@ import json
 
 import pytest
 
+import settings
+
 
 async def test_create_user(client, get_user_from_database):
     user_data = {
@@ -61,10 +63,8 @@ async def test_create_user_duplicate_email_error(client, get_user_from_database)
     assert str(user_from_db["user_id"]) == data_from_resp["user_id"]
     resp = client.post("/user/", data=json.dumps(user_data_same))
     assert resp.status_code == 503
-    assert (
-        'duplicate key value violates unique constraint "users_email_key"'
-        in resp.json()["detail"]
-    )
+    # имя ограничения и текст ошибки базы не попадают в ответ
+    assert resp.json() == {"detail": "Database error, try again later."}
 
 
 @pytest.mark.parametrize(
@@ -135,3 +135,20 @@ async def test_create_user_validation_error(
     data_from_resp = resp.json()
     assert resp.status_code == expected_status_code
     assert data_from_resp == expected_detail
+
+
+async def test_create_user_hashing_queue_full(client, monkeypatch):
+    # очередь пула хеширования считается заполненной
+    monkeypatch.setattr(settings, "HASHING_MAX_PENDING", 0)
+    monkeypatch.setattr(settings, "ADMISSION_RETRY_AFTER_SECONDS", 3)
+    user_data = {
+        "name": "Busy",
+        "surname": "User",
+        "email": "busy@sdf.com",
+        "password": "SamplePass1!",
+    }
+
+    resp = client.post("/user/", data=json.dumps(user_data))
+    assert resp.status_code == 503
+    assert resp.json() == {"detail": "Server is busy, try again later."}
+    assert resp.headers["Retry-After"] == "3"
@@ -0,0 +1,61 @@
+from uuid import uuid4
+
+from prometheus_client import REGISTRY
+
+from db.dals import get_user_dal
+from db.models import PortalRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+def statement_rows(method: str) -> float:
+    value = REGISTRY.get_sample_value("db_statement_rows_total", {"method": method})
+    return value or 0
+
+
+async def test_rows_counted_for_select(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Metrics",
+        "surname": "User",
+        "email": "metrics@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    # метка - имя метода выбранной реализации UserDAL
+    method = get_user_dal(None).get_user_by_id.__qualname__
+    rows_before = statement_rows(method)
+
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+    assert statement_rows(method) == rows_before + 1
+
+    resp = client.get(f"/user/?user_id={uuid4()}", headers=headers)
+    assert resp.status_code == 404
+    assert statement_rows(method) == rows_before + 1
+
+
+async def test_rows_counted_for_authorized_write(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Metrics",
+        "surname": "User",
+        "email": "metrics@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    # запись с проверкой прав - это SELECT с CTE
+    method = get_user_dal(None).update_user_authorized.__qualname__
+    rows_before = statement_rows(method)
+
+    resp = client.patch(
+        f"/user/?user_id={user_data['user_id']}",
+        json={"name": "Changed"},
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 200
+    assert statement_rows(method) == rows_before + 1
@@ -3,6 +3,7 @@ from uuid import uuid4
 import pytest
 
 from db.models import PortalRole
+from db.models import roles_from_mask
 from tests.conftest import create_test_auth_headers_for_user
 
 
@@ -309,4 +310,142 @@ async def test_reject_delete_superadmin(
     assert resp.json() == {"detail": "Superadmin cannot be deleted via API."}
 
     user_from_database = await get_user_from_database(user_for_deletion["user_id"])
-    assert PortalRole.ROLE_PORTAL_SUPERADMIN in dict(user_from_database[0])["roles"]
+    assert PortalRole.ROLE_PORTAL_SUPERADMIN in roles_from_mask(
+        dict(user_from_database[0])["role_mask"]
+    )
+
+
+async def test_delete_inactive_user_not_found(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Admin",
+        "surname": "Delete",
+        "email": "admin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    inactive_user_data = {
+        "user_id": uuid4(),
+        "name": "Inactive",
+        "surname": "User",
+        "email": "inactive@sdf.com",
+        "is_active": False,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    for user_data in [admin_data, inactive_user_data]:
+        await create_user_in_database(**user_data)
+
+    resp = client.delete(
+        f"/user/?user_id={inactive_user_data['user_id']}",
+        headers=create_test_auth_headers_for_user(admin_data["email"]),
+    )
+    assert resp.status_code == 404
+    assert resp.json() == {
+        "detail": f"User with id {inactive_user_data['user_id']} not found."
+    }
+
+
+async def test_delete_users_bulk_by_admin(
+    client, create_user_in_database, get_user_from_database
+):
+    def user_data(email, roles, is_active=True):
+        return {
+            "user_id": uuid4(),
+            "name": "Bulk",
+            "surname": "Delete",
+            "email": email,
+            "is_active": is_active,
+            "hashed_password": "SampleHashedPass",
+            "roles": roles,
+        }
+
+    admin = user_data("bulkadmin@sdf.com", ["ROLE_PORTAL_USER", "ROLE_PORTAL_ADMIN"])
+    user = user_data("bulkuser@sdf.com", ["ROLE_PORTAL_USER"])
+    other_admin = user_data(
+        "bulkotheradmin@sdf.com", ["ROLE_PORTAL_USER", "ROLE_PORTAL_ADMIN"]
+    )
+    superadmin = user_data("bulksuperadmin@sdf.com", ["ROLE_PORTAL_SUPERADMIN"])
+    inactive = user_data("bulkinactive@sdf.com", ["ROLE_PORTAL_USER"], False)
+    for data in [admin, user, other_admin, superadmin, inactive]:
+        await create_user_in_database(**data)
+    user_ids = [
+        str(user_id)
+        for user_id in [
+            user["user_id"],
+            other_admin["user_id"],
+            superadmin["user_id"],
+            inactive["user_id"],
+            uuid4(),
+        ]
+    ]
+
+    resp = client.request(
+        "DELETE",
+        "/user/bulk",
+        json={"user_ids": user_ids},
+        headers=create_test_auth_headers_for_user(admin["email"]),
+    )
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "deactivated": 1,
+        "results": [
+            {"user_id": user_ids[0], "status": "deactivated"},
+            {"user_id": user_ids[1], "status": "forbidden"},
+            {"user_id": user_ids[2], "status": "forbidden"},
+            {"user_id": user_ids[3], "status": "already_inactive"},
+            {"user_id": user_ids[4], "status": "not_found"},
+        ],
+    }
+    user_from_db = dict((await get_user_from_database(user["user_id"]))[0])
+    assert user_from_db["is_active"] is False
+    other_admin_from_db = dict(
+        (await get_user_from_database(other_admin["user_id"]))[0]
+    )
+    assert other_admin_from_db["is_active"] is True
+
+
+async def test_delete_users_bulk_empty_ids(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Bulk",
+        "surname": "Delete",
+        "email": "bulkempty@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": ["ROLE_PORTAL_USER"],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.request(
+        "DELETE",
+        "/user/bulk",
+        json={"user_ids": []},
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 422
+
+
+async def test_deleted_user_token_rejected(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Cached",
+        "surname": "User",
+        "email": "cached@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+
+    # пользователь попадает в кэш при первом запросе
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+
+    resp = client.delete(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Could not validate credentials"}
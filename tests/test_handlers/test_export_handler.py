@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+from uuid import uuid4
+
+from db.models import PortalRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_export_users(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Admin",
+        "surname": "Export",
+        "email": "admin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    user_data = {
+        "user_id": uuid4(),
+        "name": "User",
+        "surname": "Export",
+        "email": "user@sdf.com",
+        "is_active": False,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    for data in [admin_data, user_data]:
+        await create_user_in_database(**data)
+    headers = create_test_auth_headers_for_user(admin_data["email"])
+
+    resp = client.get("/user/export", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    users = [json.loads(line) for line in resp.text.splitlines()]
+    assert {user["email"] for user in users} == {"admin@sdf.com", "user@sdf.com"}
+    assert all("hashed_password" not in user for user in users)
+
+    resp = client.get("/user/export?format=csv", headers=headers)
+    assert resp.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(resp.text)))
+    assert len(rows) == 2
+    assert {row["user_id"] for row in rows} == {
+        str(admin_data["user_id"]),
+        str(user_data["user_id"]),
+    }
+
+
+async def test_export_users_by_user_forbidden(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "User",
+        "surname": "Export",
+        "email": "user@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    resp = client.get(
+        "/user/export", headers=create_test_auth_headers_for_user(user_data["email"])
+    )
+    assert resp.status_code == 403
@@ -1,5 +1,7 @@
 from uuid import uuid4
 
+import settings
+from api.actions.auth import verified_token_cache
 from db.models import PortalRole
 from tests.conftest import create_test_auth_headers_for_user
 
@@ -146,3 +148,94 @@ async def test_get_user_unauthorized(client, create_user_in_database):
     )
     assert resp.status_code == 401
     assert resp.json() == {"detail": "Could not validate credentials"}
+
+
+async def test_get_user_fast_json_response(
+    client, create_user_in_database, monkeypatch
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Fast",
+        "surname": "Json",
+        "email": "fast@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+
+    monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", True)
+    fast_resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert fast_resp.status_code == 200
+    assert fast_resp.headers["content-type"] == "application/json"
+    assert fast_resp.json() == resp.json()
+
+
+async def test_get_user_token_verified_once(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Cached",
+        "surname": "Token",
+        "email": "token@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    for _ in range(2):
+        resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+        assert resp.status_code == 200
+    assert len(verified_token_cache) == 1
+
+    # изменённый токен не совпадает с закэшированным и проверяется заново
+    headers["Authorization"] += "a"
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 401
+    assert len(verified_token_cache) == 1
+
+
+async def test_get_user_not_modified(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Etag",
+        "surname": "User",
+        "email": "etag@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+    etag = resp.headers["ETag"]
+
+    resp = client.get(
+        f"/user/?user_id={user_data['user_id']}",
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == etag
+    assert resp.content == b""
+
+    # изменение пользователя меняет ETag
+    resp = client.patch(
+        f"/user/?user_id={user_data['user_id']}",
+        json={"name": "Changed"},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    resp = client.get(
+        f"/user/?user_id={user_data['user_id']}",
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+    assert resp.json()["name"] == "Changed"
@@ -0,0 +1,73 @@
+from uuid import uuid4
+
+from db.models import PortalRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_list_users_keyset_pagination(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Admin",
+        "surname": "List",
+        "email": "admin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    for number in range(4):
+        await create_user_in_database(
+            user_id=uuid4(),
+            name="User",
+            surname="List",
+            email=f"user{number}@sdf.com",
+            is_active=number % 2 == 0,
+            hashed_password="SampleHashedPass",
+            roles=[PortalRole.ROLE_PORTAL_USER],
+        )
+    headers = create_test_auth_headers_for_user(admin_data["email"])
+
+    user_ids = []
+    url = "/user/list?limit=2"
+    while url is not None:
+        resp = client.get(url, headers=headers)
+        assert resp.status_code == 200
+        data_from_resp = resp.json()
+        assert len(data_from_resp["users"]) <= 2
+        user_ids.extend(user["user_id"] for user in data_from_resp["users"])
+        next_cursor = data_from_resp["next_cursor"]
+        url = None if next_cursor is None else f"/user/list?limit=2&after={next_cursor}"
+
+    assert len(user_ids) == 5
+    assert user_ids == sorted(user_ids)
+
+    resp = client.get("/user/list?is_active=false", headers=headers)
+    assert resp.status_code == 200
+    assert len(resp.json()["users"]) == 2
+
+    resp = client.get(
+        f"/user/list?role={PortalRole.ROLE_PORTAL_ADMIN.value}", headers=headers
+    )
+    assert resp.status_code == 200
+    assert [user["user_id"] for user in resp.json()["users"]] == [
+        str(admin_data["user_id"])
+    ]
+
+
+async def test_list_users_by_user_forbidden(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "User",
+        "surname": "List",
+        "email": "user@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    resp = client.get(
+        "/user/list", headers=create_test_auth_headers_for_user(user_data["email"])
+    )
+    assert resp.status_code == 403
+    assert resp.json() == {"detail": "Forbidden."}
@@ -0,0 +1,301 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import settings
+from api.actions import auth
+from db.models import PortalRole
+from hashing import create_pwd_context
+from hashing import Hasher
+
+
+async def test_login_with_self_contained_claims(
+    client, create_user_in_database, monkeypatch
+):
+    monkeypatch.setattr(settings, "JWT_SELF_CONTAINED_CLAIMS", True)
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Login",
+        "surname": "User",
+        "email": "login@sdf.com",
+        "is_active": True,
+        "hashed_password": Hasher.get_password_hash("SamplePass1!"),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 200
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["email"] == user_data["email"]
+
+    # удаление пользователя увеличивает версию токена и отзывает его
+    resp = client.delete(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Could not validate credentials"}
+
+
+async def test_login_wrong_password(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Login",
+        "surname": "User",
+        "email": "login@sdf.com",
+        "is_active": True,
+        "hashed_password": Hasher.get_password_hash("SamplePass1!"),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "WrongPass1!"},
+    )
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Incorrect username or password"}
+
+
+async def test_login_hashing_queue_full(client, create_user_in_database, monkeypatch):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Login",
+        "surname": "User",
+        "email": "login@sdf.com",
+        "is_active": True,
+        "hashed_password": Hasher.get_password_hash("SamplePass1!"),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    # очередь пула хеширования считается заполненной
+    monkeypatch.setattr(settings, "HASHING_MAX_PENDING", 0)
+    monkeypatch.setattr(settings, "ADMISSION_RETRY_AFTER_SECONDS", 3)
+
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 503
+    assert resp.json() == {"detail": "Server is busy, try again later."}
+    assert resp.headers["Retry-After"] == "3"
+
+
+async def test_refresh_token_rotation(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Refresh",
+        "surname": "User",
+        "email": "refresh@sdf.com",
+        "is_active": True,
+        "hashed_password": Hasher.get_password_hash("SamplePass1!"),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 200
+    first_refresh_token = resp.json()["refresh_token"]
+
+    resp = client.post("/login/refresh", data={"refresh_token": first_refresh_token})
+    assert resp.status_code == 200
+    data_from_resp = resp.json()
+    second_refresh_token = data_from_resp["refresh_token"]
+    assert second_refresh_token != first_refresh_token
+    headers = {"Authorization": f"Bearer {data_from_resp['access_token']}"}
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+
+    # повторное использование отозванного токена отзывает и выданный взамен
+    resp = client.post("/login/refresh", data={"refresh_token": first_refresh_token})
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Invalid refresh token"}
+
+    resp = client.post("/login/refresh", data={"refresh_token": second_refresh_token})
+    assert resp.status_code == 401
+
+
+async def test_login_prunes_refresh_tokens(
+    client, create_user_in_database, asyncpg_pool
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Refresh",
+        "surname": "User",
+        "email": "refresh@sdf.com",
+        "is_active": True,
+        "hashed_password": Hasher.get_password_hash("SamplePass1!"),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    keep_hours = settings.REFRESH_TOKEN_REVOKED_KEEP_HOURS
+    tokens = {
+        # хеш: (истекает через часов, отозван часов назад)
+        "expired": (-1, None),
+        "expired_revoked": (-1, 1),
+        "revoked_long_ago": (24 * 7, keep_hours + 1),
+        "revoked_recently": (24 * 7, 1),
+        "valid": (24 * 7, None),
+    }
+    async with asyncpg_pool.acquire() as connection:
+        for token_hash, (expires_in, revoked_ago) in tokens.items():
+            await connection.execute(
+                """INSERT INTO refresh_tokens
+                (token_id, user_id, token_hash, token_version, expires_at, revoked_at)
+                VALUES ($1, $2, $3, 0, now() + make_interval(hours => $4),
+                now() - make_interval(hours => $5))""",
+                uuid4(),
+                user_data["user_id"],
+                token_hash,
+                expires_in,
+                revoked_ago,
+            )
+
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 200
+
+    async with asyncpg_pool.acquire() as connection:
+        rows = await connection.fetch(
+            "SELECT token_hash FROM refresh_tokens WHERE user_id = $1",
+            user_data["user_id"],
+        )
+    token_hashes = {row["token_hash"] for row in rows}
+    # отозванный недавно хранится для обнаружения повторного предъявления
+    assert {"revoked_recently", "valid"} <= token_hashes
+    assert {"expired", "expired_revoked", "revoked_long_ago"} & token_hashes == set()
+    # и новый токен
+    assert len(token_hashes) == 3
+
+
+async def test_login_email_case_insensitive(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Login",
+        "surname": "User",
+        "email": "login@sdf.com",
+        "is_active": True,
+        "hashed_password": Hasher.get_password_hash("SamplePass1!"),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    resp = client.post(
+        "/login/token",
+        data={"username": "Login@SDF.com", "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 200
+
+
+@pytest.fixture
+def rehash_session(monkeypatch):
+    # перехеширование открывает свою сессию после ответа, в тестовой базе
+    test_engine = create_async_engine(settings.TEST_DATABASE_URL, future=True)
+    monkeypatch.setattr(
+        auth,
+        "async_session",
+        sessionmaker(test_engine, expire_on_commit=False, class_=AsyncSession),
+    )
+
+
+async def wait_for_password_hash_change(
+    get_user_from_database, user_id, old_hash: str
+) -> str:
+    for _ in range(100):
+        user_from_db = dict((await get_user_from_database(user_id))[0])
+        if user_from_db["hashed_password"] != old_hash:
+            return user_from_db["hashed_password"]
+        await asyncio.sleep(0.05)
+    return old_hash
+
+
+@pytest.mark.parametrize(
+    "old_pwd_context",
+    (
+        # bcrypt с меньшей стоимостью, чем в настройках
+        create_pwd_context(scheme="bcrypt", bcrypt_rounds=4),
+        # argon2 после возврата на bcrypt
+        create_pwd_context(
+            scheme="argon2",
+            argon2_memory_cost=1024,
+            argon2_time_cost=1,
+            argon2_parallelism=1,
+        ),
+    ),
+)
+async def test_login_rehashes_outdated_password_hash(
+    client,
+    create_user_in_database,
+    get_user_from_database,
+    rehash_session,
+    old_pwd_context,
+):
+    old_hash = old_pwd_context.hash("SamplePass1!")
+    assert Hasher.needs_update(old_hash)
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Rehash",
+        "surname": "User",
+        "email": "rehash@sdf.com",
+        "is_active": True,
+        "hashed_password": old_hash,
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 200
+
+    new_hash = await wait_for_password_hash_change(
+        get_user_from_database, user_data["user_id"], old_hash
+    )
+    assert new_hash != old_hash
+    assert not Hasher.needs_update(new_hash)
+    assert Hasher.verify_password("SamplePass1!", new_hash)
+
+
+async def test_login_keeps_current_password_hash(
+    client, create_user_in_database, get_user_from_database, monkeypatch
+):
+    scheduled = []
+    monkeypatch.setattr(auth, "_schedule_rehash", lambda *args: scheduled.append(args))
+    hashed_password = Hasher.get_password_hash("SamplePass1!")
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Rehash",
+        "surname": "User",
+        "email": "rehash@sdf.com",
+        "is_active": True,
+        "hashed_password": hashed_password,
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 200
+    assert scheduled == []
+
+    user_from_db = dict((await get_user_from_database(user_data["user_id"]))[0])
+    assert user_from_db["hashed_password"] == hashed_password
@@ -3,6 +3,7 @@ from uuid import uuid4
 import pytest
 
 from db.models import PortalRole
+from db.models import roles_from_mask
 from tests.conftest import create_test_auth_headers_for_user
 
 
@@ -43,7 +44,9 @@ async def test_add_admin_role_to_user_by_superadmin(
     assert len(updated_user_from_db) == 1
     updated_user_from_db = dict(updated_user_from_db[0])
     assert updated_user_from_db["user_id"] == user_data_for_promotion["user_id"]
-    assert PortalRole.ROLE_PORTAL_ADMIN in updated_user_from_db["roles"]
+    assert PortalRole.ROLE_PORTAL_ADMIN in roles_from_mask(
+        updated_user_from_db["role_mask"]
+    )
 
 
 async def test_revoke_admin_role_from_user_by_superadmin(
@@ -82,7 +85,9 @@ async def test_revoke_admin_role_from_user_by_superadmin(
     assert len(revoked_user_from_db) == 1
     revoked_user_from_db = dict(revoked_user_from_db[0])
     assert revoked_user_from_db["user_id"] == user_data_for_revoke["user_id"]
-    assert PortalRole.ROLE_PORTAL_ADMIN not in revoked_user_from_db["roles"]
+    assert PortalRole.ROLE_PORTAL_ADMIN not in roles_from_mask(
+        revoked_user_from_db["role_mask"]
+    )
 
 
 @pytest.mark.parametrize(
@@ -133,4 +138,181 @@ async def test_revoke_admin_role_from_user_by_wrong_type_of_user(
     assert len(not_revoked_user_from_db) == 1
     not_revoked_user_from_db = dict(not_revoked_user_from_db[0])
     assert not_revoked_user_from_db["user_id"] == user_data_for_revoke["user_id"]
-    assert PortalRole.ROLE_PORTAL_ADMIN in not_revoked_user_from_db["roles"]
+    assert PortalRole.ROLE_PORTAL_ADMIN in roles_from_mask(
+        not_revoked_user_from_db["role_mask"]
+    )
+
+
+async def test_grant_and_revoke_admin_role_bulk(
+    client, create_user_in_database, get_user_from_database
+):
+    superadmin_data = {
+        "user_id": uuid4(),
+        "name": "Super",
+        "surname": "Admin",
+        "email": "bulksuperadmin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_SUPERADMIN],
+    }
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Bulk",
+        "surname": "User",
+        "email": "bulkuser@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Bulk",
+        "surname": "Admin",
+        "email": "bulkadmin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    inactive_data = {
+        "user_id": uuid4(),
+        "name": "Bulk",
+        "surname": "Inactive",
+        "email": "bulkinactive@sdf.com",
+        "is_active": False,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    inactive_admin_data = {
+        "user_id": uuid4(),
+        "name": "Bulk",
+        "surname": "InactiveAdmin",
+        "email": "bulkinactiveadmin@sdf.com",
+        "is_active": False,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    for data in [
+        superadmin_data,
+        user_data,
+        admin_data,
+        inactive_data,
+        inactive_admin_data,
+    ]:
+        await create_user_in_database(**data)
+    missing_id = uuid4()
+    user_ids = [
+        str(user_id)
+        for user_id in [
+            user_data["user_id"],
+            admin_data["user_id"],
+            inactive_data["user_id"],
+            superadmin_data["user_id"],
+            missing_id,
+        ]
+    ]
+    headers = create_test_auth_headers_for_user(superadmin_data["email"])
+
+    resp = client.patch(
+        "/user/admin_privilege/bulk", json={"user_ids": user_ids}, headers=headers
+    )
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "updated": 1,
+        "results": [
+            {"user_id": user_ids[0], "status": "granted"},
+            {"user_id": user_ids[1], "status": "already_admin"},
+            {"user_id": user_ids[2], "status": "inactive"},
+            {"user_id": user_ids[3], "status": "forbidden"},
+            {"user_id": user_ids[4], "status": "not_found"},
+        ],
+    }
+    user_from_db = dict((await get_user_from_database(user_data["user_id"]))[0])
+    assert PortalRole.ROLE_PORTAL_ADMIN in roles_from_mask(user_from_db["role_mask"])
+
+    resp = client.request(
+        "DELETE",
+        "/user/admin_privilege/bulk",
+        json={"user_ids": [*user_ids[:3], str(inactive_admin_data["user_id"])]},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "updated": 2,
+        "results": [
+            {"user_id": user_ids[0], "status": "revoked"},
+            {"user_id": user_ids[1], "status": "revoked"},
+            {"user_id": user_ids[2], "status": "inactive"},
+            {"user_id": str(inactive_admin_data["user_id"]), "status": "inactive"},
+        ],
+    }
+    for user_id in [user_data["user_id"], admin_data["user_id"]]:
+        user_from_db = dict((await get_user_from_database(user_id))[0])
+        assert roles_from_mask(user_from_db["role_mask"]) == [
+            PortalRole.ROLE_PORTAL_USER
+        ]
+    # роль деактивированного пользователя не меняется
+    user_from_db = dict(
+        (await get_user_from_database(inactive_admin_data["user_id"]))[0]
+    )
+    assert PortalRole.ROLE_PORTAL_ADMIN in roles_from_mask(user_from_db["role_mask"])
+
+
+async def test_grant_admin_role_bulk_by_admin_is_forbidden(
+    client, create_user_in_database
+):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Bulk",
+        "surname": "Admin",
+        "email": "bulkadmin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    await create_user_in_database(**admin_data)
+
+    resp = client.patch(
+        "/user/admin_privilege/bulk",
+        json={"user_ids": [str(uuid4())]},
+        headers=create_test_auth_headers_for_user(admin_data["email"]),
+    )
+    assert resp.status_code == 403
+
+
+async def test_grant_admin_role_evicts_cached_principal(
+    client, create_user_in_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Cached",
+        "surname": "User",
+        "email": "cached@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    superadmin_data = {
+        "user_id": uuid4(),
+        "name": "Super",
+        "surname": "Admin",
+        "email": "superadmin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_SUPERADMIN],
+    }
+    for data in [user_data, superadmin_data]:
+        await create_user_in_database(**data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+
+    # пользователь без прав администратора попадает в кэш
+    resp = client.get("/user/list", headers=headers)
+    assert resp.status_code == 403
+
+    resp = client.patch(
+        f"/user/admin_privilege?user_id={user_data['user_id']}",
+        headers=create_test_auth_headers_for_user(superadmin_data["email"]),
+    )
+    assert resp.status_code == 200
+
+    resp = client.get("/user/list", headers=headers)
+    assert resp.status_code == 200
@@ -0,0 +1,107 @@
+from uuid import uuid4
+
+import pytest
+
+from api.actions.auth import principal_cache
+from db.models import PortalRole
+from db.models import UserRow
+from security import create_access_token
+from security import get_user_claims
+
+
+def create_claims_auth_headers(user_data: dict, **claims) -> dict[str, str]:
+    user = UserRow(
+        user_id=user_data["user_id"],
+        email=user_data["email"],
+        role_mask=sum(role.bit for role in user_data["roles"]),
+    )
+    access_token = create_access_token(data={**get_user_claims(user), **claims})
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+async def test_authorize_by_claims(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Claims",
+        "surname": "Admin",
+        "email": "claims@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    await create_user_in_database(**admin_data)
+
+    resp = client.get("/user/list", headers=create_claims_auth_headers(admin_data))
+    assert resp.status_code == 200
+    # пользователь взят из токена, по email он не загружался
+    assert len(principal_cache) == 0
+
+
+async def test_claims_rejected_after_token_version_change(
+    client, create_user_in_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Claims",
+        "surname": "User",
+        "email": "claims@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    superadmin_data = {
+        "user_id": uuid4(),
+        "name": "Claims",
+        "surname": "Superadmin",
+        "email": "superadmin@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_SUPERADMIN],
+    }
+    for data in [user_data, superadmin_data]:
+        await create_user_in_database(**data)
+    headers = create_claims_auth_headers(user_data)
+
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+
+    # смена ролей увеличивает token_version
+    resp = client.patch(
+        f"/user/admin_privilege?user_id={user_data['user_id']}",
+        headers=create_claims_auth_headers(superadmin_data),
+    )
+    assert resp.status_code == 200
+
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Could not validate credentials"}
+
+
+@pytest.mark.parametrize(
+    "claims",
+    (
+        {"uid": "not-a-uuid"},
+        {"uid": None},
+        {"rl": "admin"},
+        {"rl": None},
+        {"ver": None},
+    ),
+)
+async def test_malformed_claims_rejected(client, create_user_in_database, claims):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Claims",
+        "surname": "User",
+        "email": "claims@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    resp = client.get(
+        f"/user/?user_id={user_data['user_id']}",
+        headers=create_claims_auth_headers(user_data, **claims),
+    )
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Could not validate credentials"}
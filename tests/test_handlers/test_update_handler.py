@@ -2,6 +2,8 @@ import json
 from uuid import uuid4
 
 import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import PortalRole
 from tests.conftest import create_test_auth_headers_for_user
@@ -321,7 +323,108 @@ async def test_update_user_duplicate_email_error(client, create_user_in_database
     )
 
     assert resp.status_code == 503
-    assert (
-        'duplicate key value violates unique constraint "users_email_key"'
-        in resp.json()["detail"]
+    # имя ограничения и текст ошибки базы не попадают в ответ
+    assert resp.json() == {"detail": "Database error, try again later."}
+
+
+async def test_update_user_if_match(
+    client, create_user_in_database, get_user_from_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Match",
+        "surname": "User",
+        "email": "ifmatch@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    etag = client.get(
+        f"/user/?user_id={user_data['user_id']}", headers=headers
+    ).headers["ETag"]
+
+    resp = client.patch(
+        f"/user/?user_id={user_data['user_id']}",
+        json={"name": "First"},
+        headers={**headers, "If-Match": etag},
+    )
+    assert resp.status_code == 200
+    new_etag = resp.headers["ETag"]
+    assert new_etag != etag
+
+    # второе изменение с устаревшим ETag отклоняется
+    resp = client.patch(
+        f"/user/?user_id={user_data['user_id']}",
+        json={"name": "Second"},
+        headers={**headers, "If-Match": etag},
+    )
+    assert resp.status_code == 412
+    assert resp.headers["ETag"] == new_etag
+
+    users_from_db = await get_user_from_database(user_data["user_id"])
+    assert dict(users_from_db[0])["name"] == "First"
+
+
+async def test_update_user_email_evicts_cached_principal(
+    client, create_user_in_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Cached",
+        "surname": "User",
+        "email": "cached@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+
+    # пользователь попадает в кэш при первом запросе
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+
+    resp = client.patch(
+        f"/user/?user_id={user_data['user_id']}",
+        json={"email": "changed@sdf.com"},
+        headers=headers,
     )
+    assert resp.status_code == 200
+
+    # токен со старым email больше не принадлежит пользователю
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 401
+
+
+async def test_update_user_commit_error(
+    client, create_user_in_database, get_user_from_database, monkeypatch
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Commit",
+        "surname": "User",
+        "email": "commit@sdf.com",
+        "is_active": True,
+        "hashed_password": "SampleHashedPass",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+
+    async def failing_commit(self):
+        raise OperationalError("COMMIT", None, Exception("connection is closed"))
+
+    monkeypatch.setattr(AsyncSession, "commit", failing_commit)
+
+    # ответ отправляется только после фиксации транзакции
+    resp = client.patch(
+        f"/user/?user_id={user_data['user_id']}",
+        json={"name": "Changed"},
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 503
+    assert resp.json() == {"detail": "Database error, try again later."}
+
+    users_from_db = await get_user_from_database(user_data["user_id"])
+    assert dict(users_from_db[0])["name"] == user_data["name"]